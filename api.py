@@ -1,19 +1,47 @@
-from flask import Flask, request, jsonify
+from flask import (
+    Flask, request, jsonify, g, Response, has_request_context, send_file, stream_with_context,
+    copy_current_request_context
+)
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import requests
 import os
 import io
-import boto3
 from datetime import datetime, timedelta
-import anthropic
-from deep_translator import GoogleTranslator
 from dotenv import load_dotenv
 import base64
-from flask_cors import CORS
-from PIL import Image
+import hashlib
+import importlib
+import importlib.util
+import json
 from difflib import SequenceMatcher
 import socket
 import re
+import logging
+import logging.handlers
+import queue
+import random
+import atexit
+import cProfile
+import pstats
+import hmac
+import tempfile
+import shutil
+import subprocess
+import sys
+import wave
+import tracemalloc
+import threading
+import time
+import math
+import mmap
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
 
 def extract_date_from_text(text):
     """
@@ -49,6 +77,100 @@ def extract_date_from_text(text):
 
 load_dotenv()
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_ACCESS_SAMPLE = float(os.getenv("LOG_ACCESS_SAMPLE", "1.0"))
+CAPTURE_FILE = os.getenv("CAPTURE_FILE")
+CAPTURE_SAMPLE = float(os.getenv("CAPTURE_SAMPLE", "1.0"))
+
+class JsonLogFormatter(logging.Formatter):
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id", "sample"}
+    
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName
+        }
+        # Anything passed through extra= becomes a top-level field
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request id; runs in the caller's thread."""
+    
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id") if has_request_context() else None
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Drop a fraction of hot-path records. A record opts in with
+    extra={"sample": rate}; warnings and errors are never sampled.
+    """
+    
+    def filter(self, record):
+        rate = getattr(record, "sample", None)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+def configure_logging():
+    # Records are handed to a queue on the request thread and written to
+    # stdout by a listener thread, so handlers never block request handling.
+    stream_handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonLogFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+        ))
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(RequestContextFilter())
+    
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    app_logger = logging.getLogger("gujarat_assistant")
+    app_logger.setLevel(LOG_LEVEL)
+    app_logger.addHandler(queue_handler)
+    app_logger.propagate = False
+    return app_logger
+
+logger = configure_logging()
+
+def configure_capture_logger():
+    """Traffic capture: one JSON line per /smart_assistant request, written off-thread."""
+    if not CAPTURE_FILE:
+        return None
+    file_handler = logging.FileHandler(CAPTURE_FILE, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    capture = logging.getLogger("gujarat_assistant.capture")
+    capture.setLevel(logging.INFO)
+    capture.addHandler(logging.handlers.QueueHandler(log_queue))
+    capture.propagate = False
+    return capture
+
+capture_logger = configure_capture_logger()
+
 app = Flask(__name__)
 CORS(app)  
 
@@ -56,26 +178,194 @@ CLAUDE_API_KEY = os.environ.get('CLAUDE_API_KEY')
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 MODEL_ARN = os.getenv("MODEL_ARN")
+CLAUDE_BASE_URL = os.getenv("CLAUDE_BASE_URL") or None
+REKOGNITION_ENDPOINT_URL = os.getenv("REKOGNITION_ENDPOINT_URL") or None
+
+
+# Heavy dependencies are imported on first use rather than at import time, so
+# a worker that only ever serves weather never pays for boto3 or Pillow.
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+    
+    def __init__(self, module_name, configure=None):
+        self._module_name = module_name
+        self._configure = configure
+        self._module = None
+    
+    def _load(self):
+        if self._module is None:
+            module = importlib.import_module(self._module_name)
+            if self._configure:
+                self._configure(module)
+            self._module = module
+        return self._module
+    
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+class LazyAttribute:
+    """A class or function from a lazily imported module; callable like the real thing."""
+    
+    def __init__(self, module_name, attr):
+        self._module_name = module_name
+        self._attr = attr
+        self._target = None
+    
+    def _load(self):
+        if self._target is None:
+            self._target = getattr(importlib.import_module(self._module_name), self._attr)
+        return self._target
+    
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+    
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+boto3 = LazyModule("boto3")
+anthropic = LazyModule("anthropic")
+# PIL's decompression-bomb check follows our pixel limit (it raises at twice it)
+Image = LazyModule("PIL.Image", configure=lambda module: setattr(module, "MAX_IMAGE_PIXELS", MAX_IMAGE_PIXELS))
+GoogleTranslator = LazyAttribute("deep_translator", "GoogleTranslator")
+gTTS = LazyAttribute("gtts", "gTTS")
+sr = LazyModule("speech_recognition")
+vosk = LazyModule("vosk")
+np = LazyModule("numpy")
 
-if CLAUDE_API_KEY:
-   claude_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
-else:
-   claude_client = None
-   print("Warning: CLAUDE_API_KEY not set. Chat functionality will be limited.")
-
-if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and MODEL_ARN:
-   rekognition = boto3.client('rekognition',
-       region_name='ap-south-1',
-       aws_access_key_id=AWS_ACCESS_KEY_ID,
-       aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+CLIENT_LOCK = threading.Lock()
+_claude_client = None
+_rekognition_client = None
+
+if not CLAUDE_API_KEY:
+   logger.warning("CLAUDE_API_KEY not set. Chat functionality will be limited.")
+
+if not (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and MODEL_ARN):
+   logger.warning("AWS credentials or MODEL_ARN not set. Disease detection functionality will be limited.")
+
+def get_claude_client():
+   global _claude_client
+   if _claude_client is None and CLAUDE_API_KEY:
+       with CLIENT_LOCK:
+           if _claude_client is None:
+               _claude_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY, base_url=CLAUDE_BASE_URL)
+   return _claude_client
+
+def get_rekognition_client():
+   global _rekognition_client
+   if _rekognition_client is None and AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and MODEL_ARN:
+       with CLIENT_LOCK:
+           if _rekognition_client is None:
+               _rekognition_client = boto3.client('rekognition',
+                   region_name='ap-south-1',
+                   endpoint_url=REKOGNITION_ENDPOINT_URL,
+                   aws_access_key_id=AWS_ACCESS_KEY_ID,
+                   aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+               )
+   return _rekognition_client
+
+def prewarm_dependencies():
+   """Import the heavy modules and build the clients ahead of the first request that needs them."""
+   started = time.perf_counter()
+   steps = (
+       ("PIL", lambda: importlib.import_module("PIL.Image")),
+       ("deep_translator", lambda: importlib.import_module("deep_translator")),
+       ("numpy", lambda: importlib.import_module("numpy")),
+       ("anthropic", get_claude_client),
+       ("rekognition", get_rekognition_client),
    )
-else:
-   rekognition = None
-   print("Warning: AWS credentials or MODEL_ARN not set. Disease detection functionality will be limited.")
+   for name, warm in steps:
+       try:
+           warm()
+       except Exception as e:
+           logger.warning("Pre-warming %s failed: %s", name, e)
+   logger.info("Dependencies pre-warmed", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 1)})
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
-MAX_FILE_SIZE = 4_000_000
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "4000000"))
 MAX_IMAGE_DIMENSION = 4096
+# Header-declared size limit, checked before any pixel is decoded
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "40000000"))
+IMAGE_SPOOL_BYTES = 512 * 1024
+RAW_IMAGE_MIMETYPES = ('image/jpeg', 'image/jpg', 'image/png')
+
+# Local pre-check before Rekognition, scored on a copy this many pixels wide.
+# Sharpness is the variance of the Laplacian at that size; plant ratio is the
+# share of green or yellow-green pixels.
+IMAGE_QUALITY_GATE = os.getenv("IMAGE_QUALITY_GATE", "1") == "1"
+QUALITY_GATE_DIMENSION = 256
+MIN_IMAGE_SHARPNESS = float(os.getenv("MIN_IMAGE_SHARPNESS", "25"))
+MIN_IMAGE_BRIGHTNESS = float(os.getenv("MIN_IMAGE_BRIGHTNESS", "35"))
+MAX_IMAGE_BRIGHTNESS = float(os.getenv("MAX_IMAGE_BRIGHTNESS", "225"))
+MIN_PLANT_RATIO = float(os.getenv("MIN_PLANT_RATIO", "0.05"))
+
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+DATA_GOV_URL = os.getenv("DATA_GOV_URL", "https://api.data.gov.in/resource/35985678-0d79-46b4-9ed6-6f13308a1d24")
+DATA_GOV_API_KEY = os.getenv("DATA_GOV_API_KEY", "579b464db66ec23bdd000001cdd3946e44ce4aad7209ff7b23ac571b")
+DATA_GOV_PAGE_SIZE = 5000
+ARRIVALS_FRESH_SECONDS = int(os.getenv("ARRIVALS_FRESH_SECONDS", "900"))
+ARRIVALS_SYNC_INTERVAL = int(os.getenv("ARRIVALS_SYNC_INTERVAL", "3600"))
+ARRIVALS_BACKFILL_DAYS = int(os.getenv("ARRIVALS_BACKFILL_DAYS", "7"))
+# Older days are kept only while they keep being asked for
+ARRIVALS_QUERIED_RETENTION_DAYS = int(os.getenv("ARRIVALS_QUERIED_RETENTION_DAYS", "3"))
+ARRIVALS_PRUNE_INTERVAL = 3600
+MARKET_COMPARISON_TOP_N = 5
+COMMODITY_PAGE_SIZE = 5
+COMMODITY_MAX_PAGE_SIZE = 50
+COMMODITY_RESULT_TTL = int(os.getenv("COMMODITY_RESULT_TTL", "900"))
+TRACE_FILE = os.getenv("TRACE_FILE")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "gujarat_assistant_profiles"))
+PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", "20"))
+NEAREST_MARKETS_K = int(os.getenv("NEAREST_MARKETS_K", "3"))
+EARTH_RADIUS_KM = 6371.0
+MAX_GPS_DISTRICT_KM = 150
+WEATHER_GRID_DEG = 0.05
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", "86400"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gujarat_assistant_audio"))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_MAX_CHARS = int(os.getenv("TTS_MAX_CHARS", "3000"))
+TTS_BACKEND_NAME = os.getenv("TTS_BACKEND", "gtts").lower()
+TTS_SUBPROCESS_TIMEOUT = float(os.getenv("TTS_SUBPROCESS_TIMEOUT", "30"))
+ESPEAK_BINARY = os.getenv("ESPEAK_BINARY", "espeak-ng")
+ESPEAK_SPEED_WPM = int(os.getenv("ESPEAK_SPEED_WPM", "150"))
+PIPER_BINARY = os.getenv("PIPER_BINARY", "piper")
+# Comma-separated language=model pairs, e.g. "hi=/models/hi_IN.onnx,en=/models/en_IN.onnx"
+PIPER_MODELS = os.getenv("PIPER_MODELS", "")
+AUDIO_CATALOGUE_DIR = os.getenv("AUDIO_CATALOGUE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets"))
+AUDIO_CATALOGUE_BUILD_ON_BOOT = os.getenv("AUDIO_CATALOGUE_BUILD_ON_BOOT", "1") == "1"
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "30"))
+AUDIO_VARIANT_CACHE_MAX_BYTES = int(os.getenv("AUDIO_VARIANT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+STT_BACKEND_NAME = os.getenv("STT_BACKEND", "google").lower()
+STT_MAX_AUDIO_BYTES = int(os.getenv("STT_MAX_AUDIO_BYTES", str(10 * 1024 * 1024)))
+STT_MAX_SECONDS = int(os.getenv("STT_MAX_SECONDS", "60"))
+STT_SAMPLE_RATE = 16000
+# Comma-separated language=model-directory pairs, e.g. "hi=/models/vosk-model-small-hi-0.22"
+VOSK_MODELS = os.getenv("VOSK_MODELS", "")
+VOICE_SESSION_WORKERS = int(os.getenv("VOICE_SESSION_WORKERS", "8"))
+VOICE_CHUNK_BYTES = 8192
+DISEASE_JOB_WORKERS = int(os.getenv("DISEASE_JOB_WORKERS", "2"))
+DISEASE_JOB_QUEUE_SIZE = int(os.getenv("DISEASE_JOB_QUEUE_SIZE", "32"))
+DISEASE_JOB_TTL = int(os.getenv("DISEASE_JOB_TTL", "3600"))
+DISEASE_JOB_RETRY_AFTER = int(os.getenv("DISEASE_JOB_RETRY_AFTER", "10"))
+# Comma-separated hosts a job may call back; callbacks are refused when empty
+DISEASE_CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("DISEASE_CALLBACK_HOSTS", "").split(",") if host.strip()}
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+# Comma-separated upstreams whose open breaker fails /ready. Empty by default:
+# one dependency outage must not drain every worker, since most intents don't
+# use it. Breaker state is reported either way.
+READY_REQUIRED_UPSTREAMS = [name.strip() for name in os.getenv("READY_REQUIRED_UPSTREAMS", "").split(",") if name.strip()]
+
+# Request bodies may carry base64 (a third larger) plus form or JSON framing.
+# The app-wide cap fits the largest endpoint; smaller ones tighten it per request.
+BODY_OVERHEAD_BYTES = 64 * 1024
+IMAGE_REQUEST_MAX_BYTES = MAX_FILE_SIZE * 4 // 3 + BODY_OVERHEAD_BYTES
+AUDIO_REQUEST_MAX_BYTES = STT_MAX_AUDIO_BYTES * 4 // 3 + BODY_OVERHEAD_BYTES
+app.config['MAX_CONTENT_LENGTH'] = max(IMAGE_REQUEST_MAX_BYTES, AUDIO_REQUEST_MAX_BYTES)
+ENDPOINT_BODY_LIMITS = {"smart_assistant": IMAGE_REQUEST_MAX_BYTES, "submit_disease_job": IMAGE_REQUEST_MAX_BYTES}
 
 GUJARAT_DISTRICTS = {
    "Ahmedabad": {"lat": 23.0225, "lon": 72.5714},
@@ -316,6 +606,51 @@ DISEASE_MESSAGES = {
        "en": "Model is not running or image processing failed",
        "hi": "मॉडल नहीं चल रहा है या छवि प्रसंस्करण विफल हुआ",
        "gu": "મોડેલ ચાલી રહ્યું નથી અથવા છબી પ્રક્રિયા નિષ્ફળ થઈ",
+   },
+   "image_too_large": {
+       "en": "The image is too large. Please upload a smaller photo.",
+       "hi": "छवि बहुत बड़ी है। कृपया छोटी फोटो अपलोड करें।",
+       "gu": "છબી ખૂબ મોટી છે. કૃપા કરીને નાની છબી અપલોડ કરો.",
+   },
+   "retake_blurry": {
+       "en": "The photo is blurry. Hold the phone steady, tap on the leaf to focus and take it again.",
+       "hi": "फोटो धुंधली है। फोन को स्थिर रखें, पत्ती पर टैप करके फोकस करें और फिर से फोटो लें।",
+       "gu": "ફોટો ઝાંખો છે. ફોન સ્થિર રાખો, પાંદડા પર ટેપ કરીને ફોકસ કરો અને ફરીથી ફોટો લો.",
+   },
+   "retake_too_dark": {
+       "en": "The photo is too dark. Please take it again in daylight.",
+       "hi": "फोटो बहुत अंधेरी है। कृपया दिन के उजाले में फिर से फोटो लें।",
+       "gu": "ફોટો ખૂબ અંધારો છે. કૃપા કરીને દિવસના પ્રકાશમાં ફરીથી ફોટો લો.",
+   },
+   "retake_too_bright": {
+       "en": "The photo is too bright. Please take it again in shade, away from direct sunlight.",
+       "hi": "फोटो बहुत चमकीली है। कृपया सीधी धूप से हटकर छाया में फिर से फोटो लें।",
+       "gu": "ફોટો ખૂબ તેજસ્વી છે. કૃપા કરીને સીધા તડકાથી દૂર છાંયડામાં ફરીથી ફોટો લો.",
+   },
+   "retake_not_plant": {
+       "en": "No leaf was found in the photo. Please take a close-up of the affected leaf or plant.",
+       "hi": "फोटो में कोई पत्ती नहीं मिली। कृपया प्रभावित पत्ती या पौधे की नज़दीक से फोटो लें।",
+       "gu": "ફોટોમાં કોઈ પાંદડું મળ્યું નથી. કૃપા કરીને અસરગ્રસ્ત પાંદડા અથવા છોડનો નજીકથી ફોટો લો.",
+   },
+   "job_queued": {
+       "en": "Your photo has been received and is being checked.",
+       "hi": "आपकी फोटो मिल गई है और उसकी जांच की जा रही है।",
+       "gu": "તમારો ફોટો મળી ગયો છે અને તેની તપાસ થઈ રહી છે.",
+   },
+   "job_pending": {
+       "en": "Your photo is still being checked. Please wait a moment.",
+       "hi": "आपकी फोटो की जांच अभी चल रही है। कृपया थोड़ा इंतज़ार करें।",
+       "gu": "તમારા ફોટાની તપાસ હજુ ચાલુ છે. કૃપા કરીને થોડી રાહ જુઓ.",
+   },
+   "job_busy": {
+       "en": "Too many photos are being checked right now. Please try again in a few seconds.",
+       "hi": "अभी बहुत सारी फोटो की जांच हो रही है। कृपया कुछ सेकंड बाद फिर से प्रयास करें।",
+       "gu": "અત્યારે ઘણા ફોટાની તપાસ થઈ રહી છે. કૃપા કરીને થોડી સેકંડ પછી ફરી પ્રયાસ કરો.",
+   },
+   "job_not_found": {
+       "en": "This photo check was not found or has expired. Please upload the photo again.",
+       "hi": "यह फोटो जांच नहीं मिली या समाप्त हो गई है। कृपया फोटो फिर से अपलोड करें।",
+       "gu": "આ ફોટો તપાસ મળી નથી અથવા સમાપ્ત થઈ ગઈ છે. કૃપા કરીને ફોટો ફરીથી અપલોડ કરો.",
    }
 }
 
@@ -338,6 +673,455 @@ RESTRICTED_QUERY_RESPONSE = {
     "gu": "હું ફક્ત ગુજરાત માટે હવામાન આગાહી, માંડી કોમોડિટી ભાવ અને શાકભાજીના રોગોની ઓળખ માટે જ મદદ કરી શકું છું. કૃપા કરીને ફક્ત આ વિષયો વિશે જ પૂછો."
 }
 
+VOICE_MESSAGES = {
+    "no_speech": {
+        "en": "I couldn't hear anything. Please speak clearly and try again.",
+        "hi": "मुझे कुछ सुनाई नहीं दिया। कृपया साफ़ बोलें और फिर से प्रयास करें।",
+        "gu": "મને કંઈ સંભળાયું નહીં. કૃપા કરીને સ્પષ્ટ બોલો અને ફરી પ્રયાસ કરો."
+    }
+}
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def build_district_neighbours():
+    """Precompute, for every district, all other districts sorted by great-circle distance."""
+    neighbours = {}
+    for district, coords in GUJARAT_DISTRICTS.items():
+        distances = [
+            (other, round(haversine_km(coords['lat'], coords['lon'], other_coords['lat'], other_coords['lon']), 1))
+            for other, other_coords in GUJARAT_DISTRICTS.items()
+            if other != district
+        ]
+        distances.sort(key=lambda item: item[1])
+        neighbours[district] = distances
+    return neighbours
+
+DISTRICT_NEIGHBOURS = build_district_neighbours()
+
+def nearest_districts(district, k=NEAREST_MARKETS_K):
+    return DISTRICT_NEIGHBOURS.get(district, [])[:k]
+
+# Unit vectors on the sphere: the nearest district is the one with the largest
+# dot product, which avoids trigonometry per candidate at lookup time.
+def _unit_vector(lat, lon):
+    phi, lam = math.radians(lat), math.radians(lon)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+DISTRICT_UNIT_VECTORS = [
+    (district, _unit_vector(coords['lat'], coords['lon']))
+    for district, coords in GUJARAT_DISTRICTS.items()
+]
+
+def find_nearest_district(lat, lon):
+    x, y, z = _unit_vector(lat, lon)
+    district, vector = max(
+        DISTRICT_UNIT_VECTORS,
+        key=lambda item: item[1][0] * x + item[1][1] * y + item[1][2] * z
+    )
+    coords = GUJARAT_DISTRICTS[district]
+    return district, round(haversine_km(lat, lon, coords['lat'], coords['lon']), 1)
+
+def snap_to_weather_grid(lat, lon):
+    return (
+        round(round(lat / WEATHER_GRID_DEG) * WEATHER_GRID_DEG, 4),
+        round(round(lon / WEATHER_GRID_DEG) * WEATHER_GRID_DEG, 4)
+    )
+
+def resolve_location_from_coordinates(lat, lon):
+    district, distance_km = find_nearest_district(lat, lon)
+    if distance_km > MAX_GPS_DISTRICT_KM:
+        return None
+    grid_lat, grid_lon = snap_to_weather_grid(lat, lon)
+    return {
+        'district': district,
+        'confidence': 1.0,
+        'distance_km': distance_km,
+        'latitude': grid_lat,
+        'longitude': grid_lon
+    }
+
+class TTLCache:
+    """Small thread-safe LRU cache with per-entry expiry."""
+    
+    def __init__(self, name, ttl_seconds, max_entries=1024):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES[name] = self
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def items(self):
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items()]
+
+CACHES = {}
+WEATHER_CACHE = TTLCache("weather", WEATHER_CACHE_TTL, max_entries=2048)
+COMMODITY_RESULT_CACHE = TTLCache("commodity_results", COMMODITY_RESULT_TTL, max_entries=256)
+TRANSLATION_CACHE = TTLCache("translations", TRANSLATION_CACHE_TTL, max_entries=4096)
+
+# Minimal Prometheus-style metrics. Each observation is a dict update under a
+# lock, cheap enough to leave on in production; /metrics renders the text format.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS = []
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metric:
+    kind = "untyped"
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labelnames)
+    
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+    
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + list(extra or [])
+        if not pairs:
+            return ""
+        escaped = (f'{label}="{_escape_label_value(value)}"' for label, value in pairs)
+        return "{" + ",".join(escaped) + "}"
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+    
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+INTENT_REQUESTS = Counter(
+    "assistant_requests_total", "Routed /smart_assistant requests by intent and HTTP status.", ("intent", "status")
+)
+INTENT_LATENCY = Histogram(
+    "assistant_request_duration_seconds", "End-to-end /smart_assistant latency by routed intent.", ("intent",)
+)
+UPSTREAM_LATENCY = Histogram(
+    "assistant_upstream_duration_seconds", "Latency of calls to upstream services.", ("upstream",)
+)
+UPSTREAM_ERRORS = Counter(
+    "assistant_upstream_errors_total", "Failed calls to upstream services.", ("upstream",)
+)
+IN_FLIGHT = Gauge("assistant_requests_in_flight", "HTTP requests currently being served.", ("endpoint",))
+ARRIVALS_LOOKUPS = Counter(
+    "assistant_arrivals_store_lookups_total", "Arrivals store lookups by result (hit, miss or shared in-flight fetch).", ("result",)
+)
+
+UPSTREAM_BREAKER_STATE = Gauge(
+    "assistant_upstream_breaker_open", "1 while an upstream's circuit breaker is open or half-open.", ("upstream",)
+)
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After failure_threshold failures in a row the
+    upstream is skipped for reset_seconds, then a single trial call is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+    
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        UPSTREAM_BREAKER_STATE.set(0, upstream=name)
+    
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+    
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+    
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+        UPSTREAM_BREAKER_STATE.set(0, upstream=self.name)
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            tripped = self._trial_in_flight or self.failures >= self.failure_threshold
+            self._trial_in_flight = False
+            if tripped:
+                self.opened_at = time.time()
+        if tripped:
+            UPSTREAM_BREAKER_STATE.set(1, upstream=self.name)
+            logger.warning("Circuit breaker opened", extra={"upstream": self.name, "failures": self.failures})
+    
+    def release_trial(self):
+        """Frees the half-open trial slot without judging the upstream either way."""
+        with self._lock:
+            self._trial_in_flight = False
+
+BREAKERS = {}
+BREAKERS_LOCK = threading.Lock()
+
+def get_breaker(upstream):
+    breaker = BREAKERS.get(upstream)
+    if breaker is None:
+        with BREAKERS_LOCK:
+            breaker = BREAKERS.setdefault(upstream, CircuitBreaker(upstream))
+    return breaker
+
+# Client libraries whose own exceptions mean the upstream failed or refused us
+UPSTREAM_ERROR_PACKAGES = (
+    "requests", "urllib3", "httpx", "anthropic", "botocore", "deep_translator", "gtts", "speech_recognition"
+)
+
+def is_upstream_error(error):
+    """True for transport and service errors; bugs in our own call (TypeError and the like) are not the upstream's fault."""
+    if isinstance(error, (requests.exceptions.RequestException, OSError)):
+        return True
+    return type(error).__module__.split(".")[0] in UPSTREAM_ERROR_PACKAGES
+
+for _upstream in ("open_meteo", "data_gov_in", "google_translate", "anthropic", "rekognition", "google_tts", "google_stt"):
+    get_breaker(_upstream)
+
+@contextmanager
+def track_upstream(upstream):
+    breaker = get_breaker(upstream)
+    if not breaker.allow():
+        UPSTREAM_ERRORS.inc(upstream=upstream)
+        raise CircuitOpenError(f"{upstream} circuit breaker is open")
+    start = time.perf_counter()
+    recorded = False
+    try:
+        with span(f"upstream_{upstream}"):
+            yield
+    except Exception as e:
+        if is_upstream_error(e):
+            UPSTREAM_ERRORS.inc(upstream=upstream)
+            breaker.record_failure()
+            recorded = True
+        raise
+    else:
+        breaker.record_success()
+        recorded = True
+    finally:
+        if not recorded:
+            # A bug or an interrupt (KeyboardInterrupt, GeneratorExit) must not
+            # leave a half-open breaker waiting forever on its trial call
+            breaker.release_trial()
+        UPSTREAM_LATENCY.observe(time.perf_counter() - start, upstream=upstream)
+
+# Per-request spans: (name, start offset, duration) in seconds relative to the
+# start of the request. Work outside a request context (sync thread, executor
+# workers) is not traced.
+@contextmanager
+def span(name):
+    if not has_request_context() or 'spans' not in g:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.spans.append((name, start - g.request_started, time.perf_counter() - start))
+
+def traced(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def summarize_spans(state=None):
+    state = g if state is None else state
+    totals = {}
+    for name, _, duration in state.get('spans', []):
+        total, calls = totals.get(name, (0.0, 0))
+        totals[name] = (total + duration, calls + 1)
+    totals["total"] = (time.perf_counter() - state.request_started, 1)
+    return totals
+
+def server_timing_header(totals):
+    entries = []
+    for name, (duration, calls) in totals.items():
+        entry = f"{name};dur={duration * 1000:.1f}"
+        if calls > 1:
+            entry += f';desc="{calls} calls"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+TRACE_LOCK = threading.Lock()
+
+def export_trace(request_id, path, spans, request_wall_start, total_duration):
+    """
+    Append one request's spans to TRACE_FILE in Chrome trace event format
+    (open in chrome://tracing or Perfetto; the closing bracket is optional).
+    """
+    pid = os.getpid()
+    tid = threading.get_ident()
+    base_us = int(request_wall_start * 1_000_000)
+    events = [{
+        "name": path, "cat": "request", "ph": "X", "ts": base_us,
+        "dur": int(total_duration * 1_000_000), "pid": pid, "tid": tid,
+        "args": {"request_id": request_id}
+    }]
+    for name, offset, duration in spans:
+        events.append({
+            "name": name, "cat": "stage", "ph": "X", "ts": base_us + int(offset * 1_000_000),
+            "dur": int(duration * 1_000_000), "pid": pid, "tid": tid,
+            "args": {"request_id": request_id}
+        })
+    
+    with TRACE_LOCK:
+        new_file = not os.path.exists(TRACE_FILE) or os.path.getsize(TRACE_FILE) == 0
+        with open(TRACE_FILE, 'a', encoding='utf-8') as trace_file:
+            if new_file:
+                trace_file.write("[\n")
+            for event in events:
+                trace_file.write(json.dumps(event) + ",\n")
+
+def set_intent(intent):
+    g.intent = intent
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    
+    cache_lines = {
+        "assistant_cache_hits_total": ("counter", "Cache hits by cache.", []),
+        "assistant_cache_misses_total": ("counter", "Cache misses by cache.", []),
+        "assistant_cache_hit_ratio": ("gauge", "Cache hit ratio since start by cache.", []),
+        "assistant_cache_entries": ("gauge", "Current number of entries by cache.", [])
+    }
+    for name, cache in CACHES.items():
+        lookups = cache.hits + cache.misses
+        cache_lines["assistant_cache_hits_total"][2].append((name, cache.hits))
+        cache_lines["assistant_cache_misses_total"][2].append((name, cache.misses))
+        cache_lines["assistant_cache_hit_ratio"][2].append((name, round(cache.hits / lookups, 4) if lookups else 0))
+        cache_lines["assistant_cache_entries"][2].append((name, len(cache)))
+    for metric_name, (kind, documentation, samples) in cache_lines.items():
+        lines.append(f"# HELP {metric_name} {documentation}")
+        lines.append(f"# TYPE {metric_name} {kind}")
+        lines.extend(f'{metric_name}{{cache="{name}"}} {value}' for name, value in samples)
+    
+    return "\n".join(lines) + "\n"
+
+UPSTREAM_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="upstream")
+
 def find_free_port():
     for port in range(5000, 6000):
         try:
@@ -367,6 +1151,12 @@ def create_response(message, data=None, status=200, error=None):
    if error:
        response_data["data"] = {"error": error}
    
+   if has_request_context() and g.get('want_timings'):
+       response_data["timings"] = {
+           name: {"ms": round(duration * 1000, 2), "calls": calls}
+           for name, (duration, calls) in summarize_spans().items()
+       }
+   
    return jsonify(response_data), status
 
 def get_request_data():
@@ -389,37 +1179,150 @@ def get_request_data():
            except:
                return {}
    except Exception as e:
-       print(f"Error parsing request data: {e}")
+       logger.warning("Error parsing request data: %s", e)
        return {}
 
 def allowed_file(filename):
    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def convert_image_to_supported_format(image_bytes):
+class ImageTooLargeError(ValueError):
+    pass
+
+def spool_upload(stream, limit=MAX_FILE_SIZE):
+   """
+   A seekable file holding at most limit bytes of stream, in memory up to
+   IMAGE_SPOOL_BYTES and on disk beyond. Raises ImageTooLargeError at the cap
+   without reading the rest.
+   """
+   if stream.seekable():
+       # Werkzeug has already spooled multipart files; just measure them
+       stream.seek(0, os.SEEK_END)
+       size = stream.tell()
+       stream.seek(0)
+       if size > limit:
+           raise ImageTooLargeError(f"image is {size} bytes, limit is {limit}")
+       return stream
+   spool = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_BYTES)
+   received = 0
+   while True:
+       chunk = stream.read(64 * 1024)
+       if not chunk:
+           break
+       received += len(chunk)
+       if received > limit:
+           spool.close()
+           raise ImageTooLargeError(f"image exceeds {limit} bytes")
+       spool.write(chunk)
+   spool.seek(0)
+   return spool
+
+def decode_base64_image(encoded, limit=MAX_FILE_SIZE):
+   # Length is checked before decoding so an oversized string is never copied
+   if not isinstance(encoded, str):
+       raise ValueError("image must be a base64 string")
+   if len(encoded) > (limit + 2) // 3 * 4 + 4:
+       raise ImageTooLargeError(f"base64 image exceeds {limit} bytes")
+   return io.BytesIO(base64.b64decode(encoded))
+
+def inspect_image_header(image_file):
+   """
+   Read only the header: returns (format, (width, height)) for JPEG and PNG,
+   raises ValueError for anything else and ImageTooLargeError for oversized
+   dimensions. The file is rewound for the real decode.
+   """
    try:
-       image = Image.open(io.BytesIO(image_bytes))
-       
-       if image.mode in ('RGBA', 'LA', 'P'):
-           background = Image.new('RGB', image.size, (255, 255, 255))
-           if image.mode == 'P':
-               image = image.convert('RGBA')
-           background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-           image = background
-       elif image.mode != 'RGB':
-           image = image.convert('RGB')
-       
-       if image.width > MAX_IMAGE_DIMENSION or image.height > MAX_IMAGE_DIMENSION:
-           image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
-       
-       buffer = io.BytesIO()
-       image.save(buffer, format='JPEG', quality=85, optimize=True)
-       
-       print(f"Image converted to JPEG, dimensions: {image.size}")
-       return buffer.getvalue()
+       with Image.open(image_file) as image:
+           image_format, size = image.format, image.size
+   except Image.DecompressionBombError as e:
+       # PIL's own bomb check fires inside open(): too large, not unsupported
+       raise ImageTooLargeError(str(e)) from e
+   except Exception as e:
+       raise ValueError(f"unreadable image: {e}") from e
+   finally:
+       image_file.seek(0)
+   if image_format not in ('JPEG', 'PNG'):
+       raise ValueError(f"unsupported image format {image_format}")
+   if size[0] * size[1] > MAX_IMAGE_PIXELS:
+       raise ImageTooLargeError(f"image is {size[0]}x{size[1]}, limit is {MAX_IMAGE_PIXELS} pixels")
+   return image_format, size
+
+def open_rgb_image(image_source):
+   """Decoded RGB image, no larger than MAX_IMAGE_DIMENSION, from image bytes or a seekable file."""
+   image = Image.open(image_source if hasattr(image_source, 'read') else io.BytesIO(image_source))
+   # JPEG can decode straight at 1/2, 1/4 or 1/8 scale; no need to
+   # materialize a full-size bitmap only to shrink it
+   if image.format == 'JPEG' and max(image.size) > MAX_IMAGE_DIMENSION:
+       image.draft('RGB', (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+   # Decode now, so a truncated or corrupt file fails here rather than in
+   # whatever touches the pixels first
+   image.load()
+   
+   if image.mode in ('RGBA', 'LA', 'P'):
+       background = Image.new('RGB', image.size, (255, 255, 255))
+       if image.mode == 'P':
+           image = image.convert('RGBA')
+       background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+       image = background
+   elif image.mode != 'RGB':
+       image = image.convert('RGB')
+   
+   if image.width > MAX_IMAGE_DIMENSION or image.height > MAX_IMAGE_DIMENSION:
+       image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
+   return image
+
+def encode_rekognition_jpeg(image):
+   buffer = io.BytesIO()
+   image.save(buffer, format='JPEG', quality=85, optimize=True)
+   logger.debug("Image converted to JPEG, dimensions: %s", image.size)
+   return buffer.getvalue()
+
+def convert_image_to_supported_format(image_source):
+   """JPEG bytes for Rekognition from image bytes or a seekable file."""
+   try:
+       return encode_rekognition_jpeg(open_rgb_image(image_source))
    except Exception as e:
-       print(f"Error converting image: {e}")
+       logger.warning("Error converting image: %s", e)
        raise
 
+IMAGE_QUALITY_CHECKS = Counter(
+    "assistant_image_quality_checks_total", "Disease photos scored by the local quality gate, by outcome.", ("result",)
+)
+
+def measure_image_quality(image):
+   """Sharpness, mean brightness and plant-pixel ratio of an RGB image, scored on a small copy."""
+   scale = QUALITY_GATE_DIMENSION / max(image.size)
+   if scale < 1:
+       size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+       image = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+   rgb = np.asarray(image, dtype=np.float32)
+   gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+   
+   # 4-neighbour Laplacian; a low variance means few edges, i.e. blur
+   laplacian = gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * gray[1:-1, 1:-1]
+   
+   # Excess green on chromaticity keeps leaves in shade and yellowing leaves,
+   # and drops soil, sky and skin
+   excess_green = (2 * rgb[..., 1] - rgb[..., 0] - rgb[..., 2]) / (rgb.sum(axis=2) + 1.0)
+   plant = (excess_green > 0.05) & (gray > 20)
+   
+   return {
+       "sharpness": round(float(laplacian.var()), 1) if laplacian.size else 0.0,
+       "brightness": round(float(gray.mean()), 1),
+       "plant_ratio": round(float(plant.mean()), 3),
+   }
+
+def image_quality_issue(quality):
+   # Exposure first: a very dark photo also scores as blurry
+   if quality["brightness"] < MIN_IMAGE_BRIGHTNESS:
+       return "too_dark"
+   if quality["brightness"] > MAX_IMAGE_BRIGHTNESS:
+       return "too_bright"
+   if quality["sharpness"] < MIN_IMAGE_SHARPNESS:
+       return "blurry"
+   if quality["plant_ratio"] < MIN_PLANT_RATIO:
+       return "not_plant"
+   return None
+
 def translate_disease_text(text: str, target_language: str) -> str:
     try:
         if target_language == "en":
@@ -445,46 +1348,59 @@ def translate_disease_text(text: str, target_language: str) -> str:
         else:
             return text
     except Exception as e:
-        print(f"Disease text translation error: {e}")
+        logger.warning("Disease text translation error: %s", e)
         return text
 
+@traced("translate")
 def translate_text(text, target_language):
    if target_language == 'en':
        return text
    
    try:
-       if target_language == 'hi':
-           translator = GoogleTranslator(source='english', target='hindi')
-       elif target_language == 'gu':
-           translator = GoogleTranslator(source='english', target='gujarati')
-       else:
+       if target_language not in ('hi', 'gu'):
            return text
        
        cleaned_text = text.strip()
        if not cleaned_text:
            return text
        
+       cached = TRANSLATION_CACHE.get((cleaned_text, target_language))
+       if cached is not None:
+           return cached
+       
+       if target_language == 'hi':
+           translator = GoogleTranslator(source='english', target='hindi')
+       else:
+           translator = GoogleTranslator(source='english', target='gujarati')
+       
        # Simple translation with retry logic
        for attempt in range(3):
            try:
-               translated = translator.translate(cleaned_text)
+               with track_upstream("google_translate"):
+                   translated = translator.translate(cleaned_text)
                if translated and len(translated.strip()) > 0:
+                   TRANSLATION_CACHE.set((cleaned_text, target_language), translated.strip())
                    return translated.strip()
            except Exception as e:
-               print(f"Translation attempt {attempt + 1} error: {e}")
+               logger.warning("Translation attempt %d error: %s", attempt + 1, e)
                if attempt == 2:  # Last attempt
                    break
        
        # If all attempts failed, return original
-       print(f"Translation failed for: {cleaned_text[:50]}...")
+       logger.warning("Translation failed for: %s...", cleaned_text[:50])
        return text
            
    except Exception as e:
-       print(f"Translation error: {e}")
+       logger.error("Translation error: %s", e)
        return text
 
 def get_weather_data(lat, lon):
-   base_url = "https://api.open-meteo.com/v1/forecast"
+   cache_key = (round(lat, 4), round(lon, 4))
+   cached = WEATHER_CACHE.get(cache_key)
+   if cached is not None:
+       return cached
+   
+   base_url = OPEN_METEO_URL
    params = {
        'latitude': lat,
        'longitude': lon,
@@ -495,19 +1411,23 @@ def get_weather_data(lat, lon):
    }
    
    try:
-       response = requests.get(base_url, params=params, timeout=10)
-       response.raise_for_status()
-       return response.json()
+       with track_upstream("open_meteo"):
+           response = requests.get(base_url, params=params, timeout=10)
+           response.raise_for_status()
+       weather_data = response.json()
+       WEATHER_CACHE.set(cache_key, weather_data)
+       return weather_data
    except requests.exceptions.Timeout:
-       print("Weather API request timed out")
+       logger.warning("Weather API request timed out")
        return None
    except requests.exceptions.RequestException as e:
-       print(f"Error fetching weather data: {e}")
+       logger.warning("Error fetching weather data: %s", e)
        return None
    except Exception as e:
-       print(f"Unexpected error in weather API: {e}")
+       logger.exception("Unexpected error in weather API: %s", e)
        return None
 
+@traced("format")
 def format_weather_response(data, district):
    if not data:
        return "Sorry, couldn't fetch weather data."
@@ -526,205 +1446,867 @@ def format_weather_response(data, district):
    
    return response
 
-def get_commodity_prices_internal(district, date_str, language, commodity_filter=None):
-   base_url = "https://api.data.gov.in/resource/35985678-0d79-46b4-9ed6-6f13308a1d24"
-   
-   # Set default date to 01/07/2025 if no date provided
-   if not date_str:
-       date_str = "01/07/2025"
-   
-   params = {
-       "api-key": "579b464db66ec23bdd000001cdd3946e44ce4aad7209ff7b23ac571b",
-       "format": "json",
-       "filters[State]": "Gujarat",
-       "filters[Arrival_Date]": date_str,
-       "limit": "5000"
-   }
-   
-   if district:
-       params["filters[District]"] = district
-   
-   try:
-       response = requests.get(base_url, params=params)
-       response.raise_for_status()
-       api_data = response.json()
-       records = api_data.get('records', [])
-       
-       print(f"Total records found: {len(records)}")
-       
-       # Apply commodity filtering if specified - MUST match exactly what user asked for
-       if commodity_filter:
-           commodity_records = []
-           commodity_filter_lower = commodity_filter.lower()
-           
-           print(f"Filtering for commodity: {commodity_filter}")
-           
-           for record in records:
-               commodity_name = record.get('Commodity', '').lower()
-               
-               # More precise matching based on commodity type
-               if commodity_filter_lower == 'tomato':
-                   if ('tomato' in commodity_name or 'tamatar' in commodity_name):
-                       commodity_records.append(record)
-                       print(f"Found tomato match: {record.get('Commodity')}")
-               elif commodity_filter_lower == 'potato':
-                   if ('potato' in commodity_name or 'aloo' in commodity_name):
-                       commodity_records.append(record)
-                       print(f"Found potato match: {record.get('Commodity')}")
-               elif commodity_filter_lower == 'onion':
-                   if ('onion' in commodity_name or 'pyaz' in commodity_name):
-                       commodity_records.append(record)
-                       print(f"Found onion match: {record.get('Commodity')}")
-               elif commodity_filter_lower == 'brinjal':
-                   if ('brinjal' in commodity_name or 'brinzal' in commodity_name or 
-                       'eggplant' in commodity_name or 'aubergine' in commodity_name):
-                       commodity_records.append(record)
-                       print(f"Found brinjal match: {record.get('Commodity')}")
-               elif commodity_filter_lower == 'rice':
-                   if ('rice' in commodity_name and 'price' not in commodity_name):
-                       commodity_records.append(record)
-                       print(f"Found rice match: {record.get('Commodity')}")
-               else:
-                   # For other commodities, use exact matching
-                   if (commodity_filter_lower in commodity_name):
-                       commodity_records.append(record)
-                       print(f"Found {commodity_filter} match: {record.get('Commodity')}")
-           
-           print(f"Filtered records for {commodity_filter}: {len(commodity_records)}")
-           records = commodity_records
-           
-           # If no data found for the specific commodity on default date, try recent dates
-           if not records:
-               print(f"No data found for {commodity_filter} on {date_str}, trying recent dates")
-               
-               # Try last 30 days from default date
-               base_date = datetime.strptime(date_str, '%d/%m/%Y')
-               for days_back in range(1, 31):
-                   try_date = base_date - timedelta(days=days_back)
-                   try_date_str = try_date.strftime('%d/%m/%Y')
-                   
-                   params["filters[Arrival_Date]"] = try_date_str
-                   response = requests.get(base_url, params=params)
-                   response.raise_for_status()
-                   api_data = response.json()
-                   temp_records = api_data.get('records', [])
-                   
-                   # Filter for the specific commodity with same precise logic
-                   for record in temp_records:
-                       commodity_name = record.get('Commodity', '').lower()
-                       
-                       if commodity_filter_lower == 'tomato':
-                           if ('tomato' in commodity_name or 'tamatar' in commodity_name):
-                               records.append(record)
-                       elif commodity_filter_lower == 'potato':
-                           if ('potato' in commodity_name or 'aloo' in commodity_name):
-                               records.append(record)
-                       elif commodity_filter_lower == 'onion':
-                           if ('onion' in commodity_name or 'pyaz' in commodity_name):
-                               records.append(record)
-                       elif commodity_filter_lower == 'brinjal':
-                           if ('brinjal' in commodity_name or 'brinzal' in commodity_name or 
-                               'eggplant' in commodity_name or 'aubergine' in commodity_name):
-                               records.append(record)
-                       elif commodity_filter_lower == 'rice':
-                           if ('rice' in commodity_name and 'price' not in commodity_name):
-                               records.append(record)
-                       else:
-                           if (commodity_filter_lower in commodity_name):
-                               records.append(record)
-                   
-                   # If we found data, break
-                   if records:
-                       print(f"Found {len(records)} records for {commodity_filter} on {try_date_str}")
-                       break
-           
-           # CRITICAL: If commodity filter is specified but no matching records found, 
-           # return empty instead of showing all commodities
-           if commodity_filter and not records:
-               print(f"No {commodity_filter} found, returning empty result")
-               # Don't fallback to showing all commodities!
-       
-       # Limit to top results
-       if records:
-           records = records[:10]
-       
-       if not records:
-           if commodity_filter:
-               no_data_msg = f"No price data found for {commodity_filter}"
-               if district:
-                   no_data_msg += f" in {district}"
-               no_data_msg += ". This commodity may not be available in the selected market or try a different district."
-           else:
-               no_data_msg = "No commodity price data found for the selected criteria."
-           
-           if language != 'en':
-               try:
-                   no_data_msg = translate_text(no_data_msg, language)
-               except:
-                   pass
-           
-           return create_response(
-               "No commodity price data found", 
-               data={
-                   "type": "commodity",
-                   "response": no_data_msg, 
-                   "records": [],
-                   "commodity_searched": commodity_filter,
-                   "district_searched": district
-               }, 
-               status=200
-           )
-       else:
-           response_text = format_commodity_response(records, district, date_str, commodity_filter, language)
-       
-       if language != 'en':
-           try:
-               response_text = translate_text(response_text, language)
-           except Exception as e:
-               print(f"Translation failed: {e}")
-       
-       return create_response(
-           "Commodity prices retrieved successfully", 
-           data={
-               "type": "commodity",
-               "response": response_text, 
-               "records": records,
-               "commodity_searched": commodity_filter,
-               "district_searched": district
-           }, 
-           status=200
-       )
-       
-   except Exception as e:
-       return create_response(
-           "Failed to retrieve commodity prices", 
-           error=f"Error fetching commodity data: {e}", 
-           status=500
-       )
+def commodity_matches(commodity_filter_lower, commodity_name):
+    # More precise matching based on commodity type
+    if commodity_filter_lower == 'tomato':
+        return 'tomato' in commodity_name or 'tamatar' in commodity_name
+    elif commodity_filter_lower == 'potato':
+        return 'potato' in commodity_name or 'aloo' in commodity_name
+    elif commodity_filter_lower == 'onion':
+        return 'onion' in commodity_name or 'pyaz' in commodity_name
+    elif commodity_filter_lower == 'brinjal':
+        return ('brinjal' in commodity_name or 'brinzal' in commodity_name or
+                'eggplant' in commodity_name or 'aubergine' in commodity_name)
+    elif commodity_filter_lower == 'rice':
+        return 'rice' in commodity_name and 'price' not in commodity_name
+    else:
+        # For other commodities, use exact matching
+        return commodity_filter_lower in commodity_name
 
-def format_commodity_response(records, district, date, commodity_filter=None, language='en'):
-   if not records:
-       return "No commodity price data found."
-   
-   response = ""
-   
-   # Create header based on what was requested - keep simple for better translation
-   if commodity_filter and district:
-       if language == 'gu':
-           response = f"{district}માં {commodity_filter}ના ભાવો:\n\n"
-       elif language == 'hi':
-           response = f"{district} में {commodity_filter} की कीमतें:\n\n"
-       else:
-           response = f"{commodity_filter.title()} prices in {district}:\n\n"
-   elif commodity_filter:
-       if language == 'gu':
-           response = f"ગુજરાતમાં {commodity_filter}ના ભાવો:\n\n"
-       elif language == 'hi':
-           response = f"गुजरात में {commodity_filter} की कीमतें:\n\n"
-       else:
-           response = f"{commodity_filter.title()} prices in Gujarat:\n\n"
-   elif district:
-       if language == 'gu':
+@lru_cache(maxsize=1024)
+def canonical_commodity(commodity_name):
+    """Map a data.gov.in commodity name onto a COMMODITY_MAPPING key, or its lowercased self."""
+    name = commodity_name.lower().strip()
+    for commodity in COMMODITY_MAPPING:
+        if commodity_matches(commodity, name):
+            return commodity
+    return name
+
+def parse_price(price_val):
+    cleaned = clean_price(price_val)
+    return None if cleaned == 'N/A' else float(cleaned)
+
+# Arrivals fetched from data.gov.in, keyed by (date, district). A statewide
+# sync stores the whole day under (date, None) and marks the date as synced,
+# after which every district lookup for that date is answered locally.
+ARRIVALS_LOCK = threading.RLock()
+ARRIVALS_STORE = {}
+SYNCED_DATES = set()
+ARRIVAL_KEYS = set()
+
+# Materialized per-(commodity, date) market aggregates:
+# {"districts": {district: stats}, "ranking": [stats sorted by modal price]}
+COMMODITY_AGGREGATES = {}
+
+# Availability index: (commodity, district) -> sorted dates that have arrivals.
+# Either side may be None to mean "any commodity" / "statewide".
+ARRIVAL_DATES = {}
+
+# Retention: the backfill window always stays; any other date is pruned from
+# all four structures once it hasn't been looked up for
+# ARRIVALS_QUERIED_RETENTION_DAYS. date_str -> last lookup time.
+ARRIVAL_DATE_LAST_USED = {}
+
+# One upstream fetch per (date, district) at a time; concurrent callers, e.g.
+# warm-up and the sync loop at boot, wait on the same Future.
+ARRIVALS_IN_FLIGHT = {}
+_arrivals_pruned_at = time.time()
+
+def _parse_arrival_date(date_str):
+    return datetime.strptime(date_str, '%d/%m/%Y')
+
+def _is_stale(date_str, fetched_at):
+    # Past days are immutable upstream; only today's arrivals keep growing.
+    if date_str != datetime.now().strftime('%d/%m/%Y'):
+        return False
+    return time.time() - fetched_at > ARRIVALS_FRESH_SECONDS
+
+def fetch_arrivals_upstream(date_str, district=None):
+    params = {
+        "api-key": DATA_GOV_API_KEY,
+        "format": "json",
+        "filters[State]": "Gujarat",
+        "filters[Arrival_Date]": date_str,
+        "limit": str(DATA_GOV_PAGE_SIZE),
+        "offset": "0"
+    }
+    
+    if district:
+        params["filters[District]"] = district
+    
+    records = []
+    while True:
+        with track_upstream("data_gov_in"):
+            response = requests.get(DATA_GOV_URL, params=params, timeout=30)
+            response.raise_for_status()
+            page = response.json().get('records', [])
+        records.extend(page)
+        if len(page) < DATA_GOV_PAGE_SIZE:
+            return records
+        params["offset"] = str(len(records))
+
+def fetch_arrivals(date_str, district=None):
+    with ARRIVALS_LOCK:
+        ARRIVAL_DATE_LAST_USED[date_str] = time.time()
+        if date_str in SYNCED_DATES and district:
+            cached = ARRIVALS_STORE.get((date_str, None))
+            if cached and not _is_stale(date_str, cached[0]):
+                ARRIVALS_LOOKUPS.inc(result="hit")
+                return [record for record in cached[1] if record.get('District') == district]
+        cached = ARRIVALS_STORE.get((date_str, district))
+        if cached and not _is_stale(date_str, cached[0]):
+            ARRIVALS_LOOKUPS.inc(result="hit")
+            return cached[1]
+        
+        # A statewide fetch already under way covers any district of that day
+        statewide = ARRIVALS_IN_FLIGHT.get((date_str, None)) if district else None
+        pending = statewide or ARRIVALS_IN_FLIGHT.get((date_str, district))
+        if pending is None:
+            pending = ARRIVALS_IN_FLIGHT[(date_str, district)] = Future()
+            owner = True
+        else:
+            owner = False
+    
+    if not owner:
+        ARRIVALS_LOOKUPS.inc(result="shared")
+        records = pending.result()
+        if statewide is not None:
+            return [record for record in records if record.get('District') == district]
+        return records
+    
+    ARRIVALS_LOOKUPS.inc(result="miss")
+    try:
+        records = fetch_arrivals_upstream(date_str, district)
+        
+        with ARRIVALS_LOCK:
+            ARRIVALS_STORE[(date_str, district)] = (time.time(), records)
+            if district is None:
+                SYNCED_DATES.add(date_str)
+        
+        ingest_arrival_records(records)
+        pending.set_result(records)
+    except Exception as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with ARRIVALS_LOCK:
+            ARRIVALS_IN_FLIGHT.pop((date_str, district), None)
+    maybe_prune_arrivals()
+    return records
+
+def prune_arrivals(now=None):
+    """Drop every date outside the retention window from the arrivals structures; returns the dates dropped."""
+    now = now or time.time()
+    today = datetime.fromtimestamp(now)
+    keep = {(today - timedelta(days=days_back)).strftime('%d/%m/%Y') for days_back in range(ARRIVALS_BACKFILL_DAYS + 1)}
+    with ARRIVALS_LOCK:
+        cutoff = now - ARRIVALS_QUERIED_RETENTION_DAYS * 86400
+        keep.update(date_str for date_str, used_at in ARRIVAL_DATE_LAST_USED.items() if used_at >= cutoff)
+        
+        known = {key[0] for key in ARRIVALS_STORE} | {key[1] for key in COMMODITY_AGGREGATES} | set(ARRIVAL_DATE_LAST_USED)
+        dropped = known - keep
+        
+        for key in [key for key in ARRIVALS_STORE if key[0] not in keep]:
+            del ARRIVALS_STORE[key]
+        for key in [key for key in COMMODITY_AGGREGATES if key[1] not in keep]:
+            del COMMODITY_AGGREGATES[key]
+        ARRIVAL_KEYS.difference_update([identity for identity in ARRIVAL_KEYS if identity[0] not in keep])
+        SYNCED_DATES.intersection_update(keep)
+        for date_str in dropped:
+            ARRIVAL_DATE_LAST_USED.pop(date_str, None)
+        
+        kept_dates = set()
+        for date_str in keep:
+            try:
+                kept_dates.add(_parse_arrival_date(date_str))
+            except ValueError:
+                continue
+        for key in list(ARRIVAL_DATES):
+            dates = [arrival_date for arrival_date in ARRIVAL_DATES[key] if arrival_date in kept_dates]
+            if dates:
+                ARRIVAL_DATES[key] = dates
+            else:
+                del ARRIVAL_DATES[key]
+    
+    if dropped:
+        logger.info("Pruned arrivals for %d date(s)", len(dropped), extra={"dates": sorted(dropped)})
+    return dropped
+
+def maybe_prune_arrivals():
+    global _arrivals_pruned_at
+    with ARRIVALS_LOCK:
+        if time.time() - _arrivals_pruned_at < ARRIVALS_PRUNE_INTERVAL:
+            return
+        _arrivals_pruned_at = time.time()
+    prune_arrivals()
+
+def sync_arrivals(date_str):
+    """Pull a full statewide day from data.gov.in and fold it into the aggregates."""
+    with ARRIVALS_LOCK:
+        ARRIVALS_STORE.pop((date_str, None), None)
+        SYNCED_DATES.discard(date_str)
+    records = fetch_arrivals(date_str)
+    logger.info("Synced %d arrivals", len(records), extra={"date": date_str})
+    return len(records)
+
+def _arrivals_sync_loop():
+    # Backfill once so the availability index knows the recent history, then
+    # keep yesterday and today fresh. The backfill goes through the store, so
+    # days warm-up already fetched (or is fetching) are not pulled again.
+    days_to_sync = range(ARRIVALS_BACKFILL_DAYS, -1, -1)
+    sync = fetch_arrivals
+    while True:
+        for days_back in days_to_sync:
+            date_str = (datetime.now() - timedelta(days=days_back)).strftime('%d/%m/%Y')
+            try:
+                sync(date_str)
+            except Exception as e:
+                logger.error("Arrivals sync failed: %s", e, extra={"date": date_str})
+        days_to_sync = (1, 0)
+        sync = sync_arrivals
+        time.sleep(ARRIVALS_SYNC_INTERVAL)
+
+def start_arrivals_sync():
+    if ARRIVALS_SYNC_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(target=_arrivals_sync_loop, name="arrivals-sync", daemon=True)
+    thread.start()
+    return thread
+
+# Start-up warm-up. A new worker fills the caches the first requests would
+# otherwise fill on their own, and /ready stays 503 until every step finished.
+# Failed steps do not block readiness; they are reported and the caches fill
+# on demand as before.
+TRANSLATION_CATALOGUE = (
+    "Couldn't fetch weather data",
+    "Please select a file to upload",
+    "Failed to decode base64 image",
+    "Please upload an image file or provide base64 image data",
+    "Unable to generate response",
+    "No commodity price data found for the selected criteria.",
+)
+
+WARMUP_LOCK = threading.Lock()
+WARMUP_STATUS = {"state": "pending", "started_at": None, "finished_at": None, "steps": {}}
+
+def _warmup_step(name, **progress):
+    with WARMUP_LOCK:
+        step = WARMUP_STATUS["steps"].setdefault(name, {"status": "pending"})
+        step.update(progress)
+
+def _warm_clients():
+    prewarm_dependencies()
+    return {"anthropic": get_claude_client() is not None, "rekognition": get_rekognition_client() is not None}
+
+def _warm_weather():
+    districts = list(GUJARAT_DISTRICTS.items())
+    _warmup_step("weather", total=len(districts), prefetched=0)
+    prefetched = 0
+    futures = [
+        UPSTREAM_EXECUTOR.submit(get_weather_data, coords['lat'], coords['lon']) for _, coords in districts
+    ]
+    for future in futures:
+        if future.result() is not None:
+            prefetched += 1
+            _warmup_step("weather", prefetched=prefetched)
+    if not prefetched:
+        raise RuntimeError("no district weather could be fetched")
+    return {"prefetched": prefetched}
+
+def _warm_arrivals():
+    # The newest day that actually has arrivals; today's file is often empty
+    # until the first markets report.
+    for days_back in range(ARRIVALS_BACKFILL_DAYS + 1):
+        date_str = (datetime.now() - timedelta(days=days_back)).strftime('%d/%m/%Y')
+        _warmup_step("arrivals", date=date_str)
+        # Shares the store and any in-flight fetch with the sync loop's backfill
+        count = len(fetch_arrivals(date_str))
+        if count:
+            return {"date": date_str, "records": count}
+    raise RuntimeError(f"no arrivals in the last {ARRIVALS_BACKFILL_DAYS} days")
+
+def _warm_translations():
+    pairs = [(text, language) for text in TRANSLATION_CATALOGUE for language in ('hi', 'gu')]
+    _warmup_step("translations", total=len(pairs))
+    list(UPSTREAM_EXECUTOR.map(lambda pair: translate_text(*pair), pairs))
+    loaded = sum(1 for text, language in pairs if TRANSLATION_CACHE.get((text, language)) is not None)
+    if not loaded:
+        raise RuntimeError("no catalogue entries could be translated")
+    return {"loaded": loaded}
+
+def _warm_audio_catalogue():
+    missing = missing_catalogue_messages()
+    if missing and AUDIO_CATALOGUE_BUILD_ON_BOOT:
+        build_audio_catalogue()
+        missing = missing_catalogue_messages()
+    if missing:
+        raise RuntimeError(f"{len(missing)} catalogue messages have no pre-rendered audio")
+    return {"entries": len(AUDIO_CATALOGUE)}
+
+WARMUP_STEPS = (
+    ("clients", _warm_clients),
+    ("weather", _warm_weather),
+    ("arrivals", _warm_arrivals),
+    ("translations", _warm_translations),
+    ("audio_catalogue", _warm_audio_catalogue),
+)
+
+def _run_warmup_step(name, func):
+    started = time.perf_counter()
+    _warmup_step(name, status="running")
+    try:
+        details = func() or {}
+        _warmup_step(name, status="done", **details)
+    except Exception as e:
+        logger.warning("Warm-up step failed: %s", e, extra={"step": name})
+        _warmup_step(name, status="failed", error=str(e))
+    _warmup_step(name, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+
+def run_warmup():
+    """Run every warm-up step; clients first, then the cache fills in parallel."""
+    started = time.perf_counter()
+    with WARMUP_LOCK:
+        WARMUP_STATUS.update(state="running", started_at=time.time())
+        for name, _ in WARMUP_STEPS:
+            WARMUP_STATUS["steps"].setdefault(name, {"status": "pending"})
+    
+    name, func = WARMUP_STEPS[0]
+    _run_warmup_step(name, func)
+    threads = [
+        threading.Thread(target=_run_warmup_step, args=step, name=f"warmup-{step[0]}", daemon=True)
+        for step in WARMUP_STEPS[1:]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    with WARMUP_LOCK:
+        WARMUP_STATUS.update(state="done", finished_at=time.time())
+    logger.info("Warm-up finished", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+def start_warmup():
+    with WARMUP_LOCK:
+        if WARMUP_STATUS["state"] != "pending":
+            return None
+        if not WARMUP_ENABLED:
+            WARMUP_STATUS.update(state="skipped")
+            return None
+        WARMUP_STATUS["state"] = "starting"
+    thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+BACKGROUND_LOCK = threading.Lock()
+_background_started = False
+
+def start_background_tasks():
+    """
+    Start the arrivals sync and warm-up once per process. Runs on the first
+    request, so it works the same under the dev server and any WSGI server;
+    __main__ also calls it to start before the first request arrives.
+    """
+    global _background_started
+    with BACKGROUND_LOCK:
+        if _background_started:
+            return
+        _background_started = True
+    start_arrivals_sync()
+    start_warmup()
+
+def readiness_report():
+    with WARMUP_LOCK:
+        warmup = {
+            "state": WARMUP_STATUS["state"],
+            "steps": {name: dict(step) for name, step in WARMUP_STATUS["steps"].items()},
+        }
+        if WARMUP_STATUS["started_at"]:
+            end = WARMUP_STATUS["finished_at"] or time.time()
+            warmup["elapsed_s"] = round(end - WARMUP_STATUS["started_at"], 2)
+    breakers = {name: breaker.state for name, breaker in sorted(BREAKERS.items())}
+    warm = warmup["state"] in ("done", "skipped")
+    required_closed = all(breakers.get(name, "closed") == "closed" for name in READY_REQUIRED_UPSTREAMS)
+    return {
+        "ready": warm and required_closed,
+        "warmup": warmup,
+        "breakers": breakers,
+    }
+
+def ingest_arrival_records(records):
+    """
+    Incrementally fold arrival records into COMMODITY_AGGREGATES. Records already
+    seen are skipped, so overlapping district and statewide fetches are safe.
+    """
+    with ARRIVALS_LOCK:
+        touched = set()
+        for record in records:
+            identity = (
+                record.get('Arrival_Date'), record.get('District'), record.get('Market'),
+                record.get('Commodity'), record.get('Variety'), record.get('Grade')
+            )
+            if identity in ARRIVAL_KEYS:
+                continue
+            ARRIVAL_KEYS.add(identity)
+            
+            district = record.get('District')
+            date_str = record.get('Arrival_Date')
+            if not district or not date_str:
+                continue
+            
+            commodity = canonical_commodity(record.get('Commodity', ''))
+            try:
+                _index_arrival_date(commodity, district, _parse_arrival_date(date_str))
+            except ValueError:
+                continue
+            
+            modal_price = parse_price(record.get('Modal_Price'))
+            if modal_price is None:
+                continue
+            
+            bucket = COMMODITY_AGGREGATES.setdefault(
+                (commodity, date_str), {"districts": {}, "ranking": []}
+            )
+            stats = bucket["districts"].get(district)
+            if stats is None:
+                stats = bucket["districts"][district] = {
+                    "district": district,
+                    "markets": 0,
+                    "modal_sum": 0.0,
+                    "modal_price": modal_price,
+                    "min_modal_price": modal_price,
+                    "best_market": record.get('Market'),
+                    "variety": record.get('Variety')
+                }
+            stats["markets"] += 1
+            stats["modal_sum"] += modal_price
+            stats["min_modal_price"] = min(stats["min_modal_price"], modal_price)
+            if modal_price > stats["modal_price"]:
+                stats["modal_price"] = modal_price
+                stats["best_market"] = record.get('Market')
+                stats["variety"] = record.get('Variety')
+            touched.add((commodity, date_str))
+        
+        # Re-rank only the buckets this batch changed; at most one entry per district.
+        for key in touched:
+            bucket = COMMODITY_AGGREGATES[key]
+            bucket["ranking"] = sorted(
+                bucket["districts"].values(), key=lambda item: item["modal_price"], reverse=True
+            )
+
+def _index_arrival_date(commodity, district, arrival_date):
+    for key in ((commodity, district), (commodity, None), (None, district), (None, None)):
+        dates = ARRIVAL_DATES.setdefault(key, [])
+        pos = bisect_left(dates, arrival_date)
+        if pos == len(dates) or dates[pos] != arrival_date:
+            dates.insert(pos, arrival_date)
+
+def latest_arrival_date(commodity=None, district=None, on_or_before=None):
+    """
+    Newest date with arrivals for (commodity, district), optionally no later than
+    on_or_before (DD/MM/YYYY). Returns a DD/MM/YYYY string, or None if unknown.
+    """
+    with ARRIVALS_LOCK:
+        dates = ARRIVAL_DATES.get((commodity, district))
+        if not dates:
+            return None
+        if on_or_before:
+            pos = bisect_right(dates, _parse_arrival_date(on_or_before))
+            if pos == 0:
+                return None
+            return dates[pos - 1].strftime('%d/%m/%Y')
+        return dates[-1].strftime('%d/%m/%Y')
+
+def resolve_commodity_date(commodity, district):
+    if commodity:
+        commodity = canonical_commodity(commodity)
+        date_str = latest_arrival_date(commodity, district) or latest_arrival_date(commodity)
+        if date_str:
+            return date_str
+    return (
+        latest_arrival_date(None, district)
+        or latest_arrival_date()
+        or datetime.now().strftime('%d/%m/%Y')
+    )
+
+def get_market_ranking(commodity, date_str=None, top_n=MARKET_COMPARISON_TOP_N):
+    with ARRIVALS_LOCK:
+        if not date_str:
+            date_str = latest_arrival_date(commodity)
+        bucket = COMMODITY_AGGREGATES.get((commodity, date_str))
+        if not bucket:
+            return date_str, [], False
+        return date_str, [dict(item) for item in bucket["ranking"][:top_n]], date_str in SYNCED_DATES
+
+def fetch_nearby_commodity_records(district, date_str, commodity_filter_lower, k=NEAREST_MARKETS_K):
+    neighbours = nearest_districts(district, k)
+    futures = [
+        (neighbour, distance_km, UPSTREAM_EXECUTOR.submit(fetch_arrivals, date_str, neighbour))
+        for neighbour, distance_km in neighbours
+    ]
+    
+    records = []
+    nearby_districts = []
+    for neighbour, distance_km, future in futures:
+        try:
+            neighbour_records = [
+                record for record in future.result()
+                if commodity_matches(commodity_filter_lower, record.get('Commodity', '').lower())
+            ]
+        except Exception as e:
+            logger.warning("Nearby market lookup failed for %s: %s", neighbour, e)
+            continue
+        if neighbour_records:
+            records.extend(neighbour_records)
+            nearby_districts.append({"district": neighbour, "distance_km": distance_km})
+    
+    if not records:
+        return None
+    return records, nearby_districts
+
+COMMODITY_SORT_KEYS = {
+    "modal_price": lambda record: parse_price(record.get('Modal_Price')) or 0.0,
+    "market": lambda record: (record.get('Market') or '').lower(),
+    "variety": lambda record: (record.get('Variety') or '').lower()
+}
+
+def encode_commodity_cursor(query, offset):
+    payload = json.dumps(dict(query, o=offset), separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_commodity_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        offset = int(payload.pop('o'))
+    except (ValueError, KeyError, TypeError, AttributeError, UnicodeDecodeError):
+        return None, None
+    if offset < 0 or set(payload) != {'d', 't', 'c', 's', 'r'}:
+        return None, None
+    # Cursors come back from clients, so the values get the same checks as parse_paging_args
+    if not isinstance(payload['t'], str) or not all(isinstance(payload[key], (str, type(None))) for key in ('d', 'c')):
+        return None, None
+    if (payload['s'] is not None and payload['s'] not in COMMODITY_SORT_KEYS) or payload['r'] not in ('asc', 'desc'):
+        return None, None
+    return payload, offset
+
+def _commodity_query_key(query):
+    return hashlib.sha1(json.dumps(query, sort_keys=True).encode('utf-8')).hexdigest()
+
+def parse_paging_args(data):
+    """Read sort/order/page_size/cursor from a request payload; raises ValueError on bad input."""
+    sort = data.get('sort') or None
+    if sort is not None and (not isinstance(sort, str) or sort not in COMMODITY_SORT_KEYS):
+        raise ValueError(f"sort must be one of: {', '.join(COMMODITY_SORT_KEYS)}")
+    order = data.get('order') or ('desc' if sort == 'modal_price' else 'asc')
+    if not isinstance(order, str) or order.lower() not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    try:
+        page_size = int(data.get('page_size') or COMMODITY_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise ValueError("page_size must be an integer")
+    if not 1 <= page_size <= COMMODITY_MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {COMMODITY_MAX_PAGE_SIZE}")
+    cursor = data.get('cursor') or None
+    if cursor is not None and not isinstance(cursor, str):
+        raise ValueError("cursor must be a string")
+    return {"sort": sort, "order": order.lower(), "page_size": page_size, "cursor": cursor}
+
+def get_commodity_prices_internal(district, date_str, language, commodity_filter=None, sort=None, order='asc',
+                                  page_size=COMMODITY_PAGE_SIZE, offset=0):
+   # Without an explicit date, use the newest day the availability index has arrivals for
+   if not date_str:
+       date_str = resolve_commodity_date(commodity_filter, district)
+   
+   # The full filtered and sorted result set is held per query, so later pages
+   # are a slice of the cached list instead of a re-fetch and re-sort.
+   query = {"d": district, "t": date_str, "c": commodity_filter, "s": sort, "r": order}
+   query_key = _commodity_query_key(query)
+   cached = COMMODITY_RESULT_CACHE.get(query_key)
+   if cached is not None:
+       return build_commodity_page(cached, query, language, page_size, offset)
+   
+   nearby_districts = []
+   
+   try:
+       records = fetch_arrivals(date_str, district)
+       
+       logger.debug("Total records found: %d", len(records))
+       
+       # Apply commodity filtering if specified - MUST match exactly what user asked for
+       if commodity_filter:
+           commodity_filter_lower = commodity_filter.lower()
+           
+           logger.debug("Filtering for commodity: %s", commodity_filter)
+           
+           records = [
+               record for record in records
+               if commodity_matches(commodity_filter_lower, record.get('Commodity', '').lower())
+           ]
+           
+           logger.debug("Filtered records for %s: %d", commodity_filter, len(records))
+           
+           # Nothing in this district on the requested day: look at the nearest
+           # districts' same-day arrivals in one concurrent round.
+           if not records and district:
+               nearby_records = fetch_nearby_commodity_records(district, date_str, commodity_filter_lower)
+               if nearby_records:
+                   records, nearby_districts = nearby_records
+                   logger.info("Using %d %s records from districts near %s", len(records), commodity_filter, district)
+           
+           # Still nothing: jump straight to the newest earlier date the index knows about
+           if not records:
+               earlier_date = latest_arrival_date(
+                   canonical_commodity(commodity_filter), district, on_or_before=date_str
+               )
+               if earlier_date and earlier_date != date_str:
+                   records = [
+                       record for record in fetch_arrivals(earlier_date, district)
+                       if commodity_matches(commodity_filter_lower, record.get('Commodity', '').lower())
+                   ]
+                   if records:
+                       logger.info("Found %d records for %s on %s", len(records), commodity_filter, earlier_date)
+                       date_str = earlier_date
+           
+           # CRITICAL: If commodity filter is specified but no matching records found, 
+           # return empty instead of showing all commodities
+           if commodity_filter and not records:
+               logger.info("No %s found, returning empty result", commodity_filter)
+               # Don't fallback to showing all commodities!
+       
+       if not records:
+           if commodity_filter:
+               no_data_msg = f"No price data found for {commodity_filter}"
+               if district:
+                   no_data_msg += f" in {district}"
+               no_data_msg += ". This commodity may not be available in the selected market or try a different district."
+           else:
+               no_data_msg = "No commodity price data found for the selected criteria."
+           
+           if language != 'en':
+               try:
+                   no_data_msg = translate_text(no_data_msg, language)
+               except:
+                   pass
+           
+           return create_response(
+               "No commodity price data found", 
+               data={
+                   "type": "commodity",
+                   "response": no_data_msg, 
+                   "records": [],
+                   "commodity_searched": commodity_filter,
+                   "district_searched": district
+               }, 
+               status=200
+           )
+       
+       if sort:
+           records = sorted(records, key=COMMODITY_SORT_KEYS[sort], reverse=(order == 'desc'))
+       
+       result = {
+           "records": records,
+           "district": district,
+           "date": date_str,
+           "commodity_filter": commodity_filter,
+           "nearby_districts": nearby_districts
+       }
+       COMMODITY_RESULT_CACHE.set(query_key, result)
+       return build_commodity_page(result, query, language, page_size, offset)
+       
+   except Exception as e:
+       return create_response(
+           "Failed to retrieve commodity prices", 
+           error=f"Error fetching commodity data: {e}", 
+           status=500
+       )
+
+def build_commodity_page(result, query, language, page_size=COMMODITY_PAGE_SIZE, offset=0):
+   records = result["records"]
+   district = result["district"]
+   date_str = result["date"]
+   commodity_filter = result["commodity_filter"]
+   nearby_districts = result["nearby_districts"]
+   
+   page = records[offset:offset + page_size]
+   next_offset = offset + len(page)
+   next_cursor = encode_commodity_cursor(query, next_offset) if next_offset < len(records) else None
+   
+   response_text = format_commodity_response(
+       page, district, date_str, commodity_filter, language, total=len(records), start=offset
+   )
+   if nearby_districts:
+       nearby_list = ", ".join(f"{item['district']} ({item['distance_km']} km)" for item in nearby_districts)
+       response_text = (
+           f"No arrivals in {district} on {date_str}. Showing nearest markets: {nearby_list}\n\n"
+           + response_text
+       )
+   
+   if language != 'en':
+       try:
+           response_text = translate_text(response_text, language)
+       except Exception as e:
+           logger.warning("Translation failed: %s", e)
+   
+   return create_response(
+       "Commodity prices retrieved successfully", 
+       data={
+           "type": "commodity",
+           "response": response_text, 
+           "records": page,
+           "commodity_searched": commodity_filter,
+           "district_searched": district,
+           "date": date_str,
+           "nearby_districts": nearby_districts,
+           "pagination": {
+               "total": len(records),
+               "offset": offset,
+               "page_size": page_size,
+               "sort": query["s"],
+               "order": query["r"],
+               "next_cursor": next_cursor
+           }
+       }, 
+       status=200
+   )
+
+def clean_price(price_val):
+    if price_val == 'N/A' or price_val is None or price_val == '':
+        return 'N/A'
+    
+    # Convert to string and clean
+    price_str = str(price_val).strip()
+    
+    # Handle common malformed patterns
+    if not price_str or price_str.lower() in ['n/a', 'na', 'nil', '0', '']:
+        return 'N/A'
+    
+    # Remove currency symbols and extra spaces
+    # First, remove common currency symbols and extra characters
+    cleaned = re.sub(r'[₹$,\s]', '', price_str)
+    
+    # Extract only the first valid number sequence
+    numbers = re.findall(r'\d+\.?\d*', cleaned)
+    if numbers:
+        try:
+            # Take the first number found and convert to float
+            first_number = numbers[0]
+            float_val = float(first_number)
+            # Return as integer if it's a whole number, otherwise as float
+            if float_val > 0:
+                return str(int(float_val)) if float_val.is_integer() else str(float_val)
+            else:
+                return 'N/A'
+        except (ValueError, IndexError):
+            return 'N/A'
+    
+    # If no valid numbers found, try to extract digits only
+    digits_only = re.sub(r'[^\d]', '', price_str)
+    if digits_only and len(digits_only) >= 1:
+        try:
+            val = int(digits_only)
+            if val > 0:
+                return str(val)
+        except ValueError:
+            pass
+    
+    return 'N/A'
+
+def is_market_comparison_query(text_lower):
+   comparison_keywords = [
+       'compare', 'comparison', 'where to sell', 'where should i sell', 'best market',
+       'best price', 'highest price', 'all districts', 'top markets', 'top districts',
+       'kaha bechu', 'kahan beche', 'kya vechu', 'kya vechvu', 'sabse accha',
+       'तुलना', 'कहां बेच', 'कहाँ बेच', 'सबसे अच्छा', 'सबसे ज्यादा',
+       'તુલના', 'સરખામણી', 'ક્યાં વેચ', 'સૌથી સારો', 'સૌથી વધુ'
+   ]
+   return any(keyword in text_lower for keyword in comparison_keywords)
+
+def extract_top_n_from_text(text, default=MARKET_COMPARISON_TOP_N):
+    match = re.search(r'\btop\s*(\d{1,2})\b', text.lower())
+    if not match:
+        return default
+    return max(1, min(int(match.group(1)), len(GUJARAT_DISTRICTS)))
+
+@traced("format")
+def format_market_comparison_response(ranking, commodity, date_str, language='en'):
+   if language == 'gu':
+       response = f"{date_str} ના રોજ {commodity} માટે શ્રેષ્ઠ બજારો:\n\n"
+   elif language == 'hi':
+       response = f"{date_str} को {commodity} के लिए सबसे अच्छे बाजार:\n\n"
+   else:
+       response = f"Best markets for {commodity.title()} on {date_str}:\n\n"
+   
+   for i, stats in enumerate(ranking):
+       modal_price = clean_price(stats["modal_price"])
+       average_price = clean_price(stats["average_modal_price"])
+       if language == 'gu':
+           response += f"{i+1}. {stats['district']} - ₹{modal_price} ({stats['best_market']})\n"
+           response += f"   સરેરાશ: ₹{average_price}, {stats['markets']} બજારો\n\n"
+       elif language == 'hi':
+           response += f"{i+1}. {stats['district']} - ₹{modal_price} ({stats['best_market']})\n"
+           response += f"   औसत: ₹{average_price}, {stats['markets']} बाजार\n\n"
+       else:
+           response += f"{i+1}. {stats['district']} - ₹{modal_price} ({stats['best_market']})\n"
+           response += f"   Average: ₹{average_price} across {stats['markets']} market(s)\n\n"
+   
+   return response.rstrip() + "\n"
+
+def get_market_comparison_internal(commodity, date_str, language, top_n=MARKET_COMPARISON_TOP_N):
+   commodity = canonical_commodity(commodity)
+   date_str, ranking, complete = get_market_ranking(commodity, date_str, top_n)
+   
+   if not ranking:
+       no_data_msg = f"No market comparison is available yet for {commodity}"
+       if date_str:
+           no_data_msg += f" on {date_str}"
+       no_data_msg += ". Please try again after the next market data sync."
+       if language != 'en':
+           try:
+               no_data_msg = translate_text(no_data_msg, language)
+           except:
+               pass
+       return create_response(
+           "No market comparison data found",
+           data={
+               "type": "market_comparison",
+               "response": no_data_msg,
+               "ranking": [],
+               "commodity_searched": commodity,
+               "date": date_str
+           },
+           status=200
+       )
+   
+   for stats in ranking:
+       stats["average_modal_price"] = round(stats.pop("modal_sum") / stats["markets"], 2)
+   
+   return create_response(
+       "Market comparison retrieved successfully",
+       data={
+           "type": "market_comparison",
+           "response": format_market_comparison_response(ranking, commodity, date_str, language),
+           "ranking": ranking,
+           "commodity_searched": commodity,
+           "date": date_str,
+           "complete": complete
+       },
+       status=200
+   )
+
+@traced("format")
+def format_commodity_response(records, district, date, commodity_filter=None, language='en', total=None, start=0):
+   if not records:
+       return "No commodity price data found."
+   
+   response = ""
+   
+   # Create header based on what was requested - keep simple for better translation
+   if commodity_filter and district:
+       if language == 'gu':
+           response = f"{district}માં {commodity_filter}ના ભાવો:\n\n"
+       elif language == 'hi':
+           response = f"{district} में {commodity_filter} की कीमतें:\n\n"
+       else:
+           response = f"{commodity_filter.title()} prices in {district}:\n\n"
+   elif commodity_filter:
+       if language == 'gu':
+           response = f"ગુજરાતમાં {commodity_filter}ના ભાવો:\n\n"
+       elif language == 'hi':
+           response = f"गुजरात में {commodity_filter} की कीमतें:\n\n"
+       else:
+           response = f"{commodity_filter.title()} prices in Gujarat:\n\n"
+   elif district:
+       if language == 'gu':
            response = f"{district}માં કોમોડિટી ભાવો:\n\n"
        elif language == 'hi':
            response = f"{district} में कमोडिटी कीमतें:\n\n"
@@ -738,7 +2320,11 @@ def format_commodity_response(records, district, date, commodity_filter=None, la
        else:
            response = "Commodity prices in Gujarat:\n\n"
    
-   for i, record in enumerate(records[:5]):
+   if total is None:
+       total = len(records)
+       records = records[:COMMODITY_PAGE_SIZE]
+   
+   for i, record in enumerate(records, start=start):
        commodity_name = record.get('Commodity', 'N/A')
        variety = record.get('Variety', 'N/A')
        market = record.get('Market', 'N/A')
@@ -746,50 +2332,6 @@ def format_commodity_response(records, district, date, commodity_filter=None, la
        max_price = record.get('Max_Price', 'N/A')
        modal_price = record.get('Modal_Price', 'N/A')
        
-       # Clean and validate price values with more robust logic
-       def clean_price(price_val):
-           if price_val == 'N/A' or price_val is None or price_val == '':
-               return 'N/A'
-           
-           # Convert to string and clean
-           price_str = str(price_val).strip()
-           
-           # Handle common malformed patterns
-           if not price_str or price_str.lower() in ['n/a', 'na', 'nil', '0', '']:
-               return 'N/A'
-           
-           # Remove currency symbols and extra spaces
-           import re
-           # First, remove common currency symbols and extra characters
-           cleaned = re.sub(r'[₹$,\s]', '', price_str)
-           
-           # Extract only the first valid number sequence
-           numbers = re.findall(r'\d+\.?\d*', cleaned)
-           if numbers:
-               try:
-                   # Take the first number found and convert to float
-                   first_number = numbers[0]
-                   float_val = float(first_number)
-                   # Return as integer if it's a whole number, otherwise as float
-                   if float_val > 0:
-                       return str(int(float_val)) if float_val.is_integer() else str(float_val)
-                   else:
-                       return 'N/A'
-               except (ValueError, IndexError):
-                   return 'N/A'
-           
-           # If no valid numbers found, try to extract digits only
-           digits_only = re.sub(r'[^\d]', '', price_str)
-           if digits_only and len(digits_only) >= 1:
-               try:
-                   val = int(digits_only)
-                   if val > 0:
-                       return str(val)
-               except ValueError:
-                   pass
-           
-           return 'N/A'
-       
        # Clean all price values with enhanced logic
        min_price_clean = clean_price(min_price)
        max_price_clean = clean_price(max_price)
@@ -815,13 +2357,14 @@ def format_commodity_response(records, district, date, commodity_filter=None, la
            response += f"   Price Range: ₹{min_price_clean} - ₹{max_price_clean}\n"
            response += f"   Modal Price: ₹{modal_price_clean}\n\n"
    
-   if len(records) > 5:
+   remaining = total - start - len(records)
+   if remaining > 0:
        if language == 'gu':
-           response += f"...અને {len(records) - 5} વધુ આઇટમ્સ\n"
+           response += f"...અને {remaining} વધુ આઇટમ્સ\n"
        elif language == 'hi':
-           response += f"...और {len(records) - 5} और आइटम\n"
+           response += f"...और {remaining} और आइटम\n"
        else:
-           response += f"...and {len(records) - 5} more items\n"
+           response += f"...and {remaining} more items\n"
    
    # Simple note that translates well
    if language == 'gu':
@@ -859,6 +2402,7 @@ def is_query_allowed(text):
     return has_allowed and not has_restricted
 
 def get_claude_response(message, context="", language="en"):
+   claude_client = get_claude_client()
    if not claude_client:
        return "Chat service is not available."
    
@@ -886,17 +2430,18 @@ STRICT RULES:
        
        full_context = f"{context}\n\nUser: {message}" if context else message
        
-       response = claude_client.messages.create(
-           model="claude-3-7-sonnet-20250219",
-           max_tokens=150,
-           temperature=0.3,
-           system=system_prompt,
-           messages=[{"role": "user", "content": full_context}]
-       )
+       with track_upstream("anthropic"):
+           response = claude_client.messages.create(
+               model="claude-3-7-sonnet-20250219",
+               max_tokens=150,
+               temperature=0.3,
+               system=system_prompt,
+               messages=[{"role": "user", "content": full_context}]
+           )
        
        return response.content[0].text
    except Exception as e:
-       print(f"Error with Claude API: {e}")
+       logger.error("Error with Claude API: %s", e)
        return "Sorry, I'm having trouble processing your request."
 
 def similarity(a, b):
@@ -954,6 +2499,7 @@ def get_popular_districts_list(language):
     
     return popular_districts.get(language, popular_districts['en'])
 
+@traced("location")
 def extract_location_from_command(command):
     command_lower = command.lower().strip()
     
@@ -1013,7 +2559,7 @@ def extract_commodity_from_text(text):
     # First check direct translations from Gujarati/Hindi (use older flexible logic)
     for gu_word, en_word in VEGETABLE_TRANSLATIONS.items():
         if gu_word.lower() in text_lower or gu_word in text:
-            print(f"Found Gujarati/Hindi commodity: {gu_word} -> {en_word}")
+            logger.info("Found Gujarati/Hindi commodity: %s -> %s", gu_word, en_word, extra={"sample": 0.05})
             return en_word
     
     # For English text, use precise word boundary matching to avoid confusion
@@ -1040,7 +2586,7 @@ def extract_commodity_from_text(text):
     for word, commodity in english_commodities.items():
         pattern = r'\b' + re.escape(word.lower()) + r'\b'
         if re.search(pattern, text_lower):
-            print(f"Found English commodity: {word} -> {commodity}")
+            logger.info("Found English commodity: %s -> %s", word, commodity, extra={"sample": 0.05})
             return commodity
     
     # Fallback: check for phonetic variations (flexible matching for transliterated text)
@@ -1060,94 +2606,165 @@ def extract_commodity_from_text(text):
     
     for phonetic, commodity in phonetic_mapping.items():
         if phonetic in text_lower:
-            print(f"Found phonetic match: {phonetic} -> {commodity}")
+            logger.info("Found phonetic match: %s -> %s", phonetic, commodity, extra={"sample": 0.05})
             return commodity
     
     return None
 
-def handle_disease_detection(language):
-   try:
-       raw_image_bytes = None
+def image_too_large_response(error, language):
+   logger.info("Rejected image upload: %s", error)
+   return create_response(
+       DISEASE_MESSAGES["image_too_large"][language],
+       error=DISEASE_MESSAGES["image_too_large"][language],
+       status=413
+   )
+
+def disease_image_from_request(language):
+   """The uploaded photo from a multipart file or base64 JSON, as (file, None) or (None, error response)."""
+   if 'file' in request.files:
+       file = request.files['file']
        
-       if 'file' in request.files:
-           file = request.files['file']
-           
-           if file.filename == '':
-               error_msg = "Please select a file to upload"
-               if language != 'en':
-                   try:
-                       error_msg = translate_text(error_msg, language)
-                   except:
-                       pass
-               return create_response(
-                   "No file selected",
-                   error=error_msg,
-                   status=400
-               )
-           
-           raw_image_bytes = file.read()
-           
-       elif request.json and 'image' in request.json:
-           try:
-               image_data = base64.b64decode(request.json['image'])
-               raw_image_bytes = image_data
-           except Exception as e:
-               error_msg = "Failed to decode base64 image"
-               if language != 'en':
-                   try:
-                       error_msg = translate_text(error_msg, language)
-                   except:
-                       pass
-               return create_response(
-                   "Invalid base64 image data",
-                   error=error_msg,
-                   status=400
-               )
-       else:
-           error_msg = "Please upload an image file or provide base64 image data"
+       if file.filename == '':
+           error_msg = "Please select a file to upload"
            if language != 'en':
                try:
                    error_msg = translate_text(error_msg, language)
                except:
                    pass
-           return create_response(
-               "No image provided",
+           return None, create_response(
+               "No file selected",
                error=error_msg,
                status=400
            )
        
+       image_file = spool_upload(file.stream)
+       
+   elif request.is_json and request.json and 'image' in request.json:
+       try:
+           image_file = decode_base64_image(request.json['image'])
+       except ImageTooLargeError:
+           raise
+       except Exception as e:
+           error_msg = "Failed to decode base64 image"
+           if language != 'en':
+               try:
+                   error_msg = translate_text(error_msg, language)
+               except:
+                   pass
+           return None, create_response(
+               "Invalid base64 image data",
+               error=error_msg,
+               status=400
+           )
+   else:
+       error_msg = "Please upload an image file or provide base64 image data"
+       if language != 'en':
+           try:
+               error_msg = translate_text(error_msg, language)
+           except:
+               pass
+       return None, create_response(
+           "No image provided",
+           error=error_msg,
+           status=400
+       )
+   
+   return image_file, None
+
+def disease_result(message, data=None, status=200, error=None):
+   # create_response arguments as plain data, so a job can store the outcome
+   return message, {"error": error} if error else (data if data is not None else {}), status
+
+def disease_error_result(error, lang_code):
+   logger.exception("Disease detection error: %s", error)
+   error_msg = str(error)
+   if lang_code != 'en':
+       try:
+           error_msg = translate_text(f"Error processing image: {str(error)}", lang_code)
+       except:
+           error_msg = DISEASE_MESSAGES["invalid_image"][lang_code]
+   
+   return disease_result(
+       DISEASE_MESSAGES["invalid_image"][lang_code],
+       error=error_msg,
+       status=422
+   )
+
+def run_disease_detection(image_file, language):
+   """Classify one photo; returns (message, data, status) for create_response."""
+   lang_code = language if language in ['en', 'hi', 'gu'] else 'en'
+   try:
+       rekognition = get_rekognition_client()
        if not rekognition:
-           lang_code = language if language in ['en', 'hi', 'gu'] else 'en'
-           return create_response(
+           return disease_result(
                DISEASE_MESSAGES["invalid_image"][lang_code],
                error="AWS Rekognition service not configured",
                status=503
            )
        
-       print(f"Processing disease detection image of size: {len(raw_image_bytes)}")
+       try:
+           image_format, image_size = inspect_image_header(image_file)
+       except ImageTooLargeError:
+           raise
+       except ValueError as e:
+           logger.info("Rejected image upload: %s", e)
+           return disease_result(
+               DISEASE_MESSAGES["unsupported_format"][lang_code],
+               error="Failed to process image format",
+               status=415
+           )
+       
+       logger.info("Processing disease detection image", extra={"image_format": image_format, "image_size": image_size})
        
        try:
-           image_bytes = convert_image_to_supported_format(raw_image_bytes)
+           image = open_rgb_image(image_file)
        except Exception as e:
-           lang_code = language if language in ['en', 'hi', 'gu'] else 'en'
-           return create_response(
+           logger.warning("Error converting image: %s", e)
+           return disease_result(
                DISEASE_MESSAGES["unsupported_format"][lang_code],
                error="Failed to process image format",
                status=415
            )
        
-       response = rekognition.detect_custom_labels(
-           ProjectVersionArn=MODEL_ARN,
-           Image={'Bytes': image_bytes}
-       )
+       # Unusable photos get a retake message here instead of costing an inference call
+       if IMAGE_QUALITY_GATE:
+           quality = measure_image_quality(image)
+           issue = image_quality_issue(quality)
+           IMAGE_QUALITY_CHECKS.inc(result=issue or "pass")
+           if issue:
+               logger.info("Image failed quality gate: %s", issue, extra={"quality": quality})
+               retake_msg = DISEASE_MESSAGES[f"retake_{issue}"][lang_code]
+               return disease_result(
+                   retake_msg,
+                   data={
+                       "type": "disease_detection",
+                       "predictions": [],
+                       "response": retake_msg,
+                       "retake": True,
+                       "quality_issue": issue,
+                       "quality": quality
+                   },
+                   status=200
+               )
+       
+       image_bytes = encode_rekognition_jpeg(image)
+       
+       with track_upstream("rekognition"):
+           response = rekognition.detect_custom_labels(
+               ProjectVersionArn=MODEL_ARN,
+               Image={'Bytes': image_bytes}
+           )
        
-       print("AWS Rekognition Response:", response)
+       logger.info(
+           "Rekognition returned %d label(s)", len(response.get("CustomLabels", [])),
+           extra={"labels": [(label.get("Name"), label.get("Confidence")) for label in response.get("CustomLabels", [])]}
+       )
+       logger.debug("AWS Rekognition response metadata: %s", response.get("ResponseMetadata"))
        
        final_response = response.get("CustomLabels", [])
-       lang_code = language if language in ['en', 'hi', 'gu'] else 'en'
        
        if not final_response or (final_response and final_response[0]["Name"] == "Irrelevant"):
-           return create_response(
+           return disease_result(
                DISEASE_MESSAGES["no_disease"][lang_code],
                data={
                    "type": "disease_detection",
@@ -1187,7 +2804,7 @@ def handle_disease_detection(language):
            else:
                response_msg = f"Detected diseases: {diseases_list}"
        
-       return create_response(
+       return disease_result(
            DISEASE_MESSAGES["success"][lang_code],
            data={
                "type": "disease_detection",
@@ -1198,29 +2815,99 @@ def handle_disease_detection(language):
            status=200
        )
        
+   except ImageTooLargeError as e:
+       logger.info("Rejected image upload: %s", e)
+       return disease_result(
+           DISEASE_MESSAGES["image_too_large"][lang_code],
+           error=DISEASE_MESSAGES["image_too_large"][lang_code],
+           status=413
+       )
    except Exception as e:
-       print(f"Disease detection error: {str(e)}")
-       lang_code = language if language in ['en', 'hi', 'gu'] else 'en'
-       error_msg = str(e)
-       if lang_code != 'en':
-           try:
-               error_msg = translate_text(f"Error processing image: {str(e)}", lang_code)
-           except:
-               error_msg = DISEASE_MESSAGES["invalid_image"][lang_code]
+       return disease_error_result(e, lang_code)
+
+def handle_disease_detection(language, image_file=None):
+   lang_code = language if language in ['en', 'hi', 'gu'] else 'en'
+   try:
+       if image_file is None:
+           image_file, error_response = disease_image_from_request(language)
+           if error_response:
+               return error_response
        
-       return create_response(
-           DISEASE_MESSAGES["invalid_image"][lang_code],
-           error=error_msg,
-           status=422
-       )
+       return create_response(*run_disease_detection(image_file, lang_code))
+   except ImageTooLargeError as e:
+       return image_too_large_response(e, lang_code)
+   except Exception as e:
+       return create_response(*disease_error_result(e, lang_code))
+
+# Disease detection jobs. Rekognition inference is slow and limited by the
+# provisioned inference units, so a job API accepts the photo, answers 202
+# with a job id and classifies it on DISEASE_EXECUTOR. Running plus queued
+# jobs are capped by DISEASE_JOB_SLOTS; past that, submissions get 503 with
+# Retry-After instead of piling up. Finished jobs are polled from
+# DISEASE_JOBS or posted to an allowed callback URL.
+DISEASE_EXECUTOR = ThreadPoolExecutor(max_workers=DISEASE_JOB_WORKERS, thread_name_prefix="disease")
+DISEASE_JOB_SLOTS = threading.BoundedSemaphore(DISEASE_JOB_WORKERS + DISEASE_JOB_QUEUE_SIZE)
+DISEASE_JOBS = TTLCache("disease_jobs", DISEASE_JOB_TTL, max_entries=4096)
+DISEASE_JOB_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+DISEASE_JOBS_PENDING = Gauge("assistant_disease_jobs_pending", "Disease detection jobs queued or running.")
+DISEASE_JOB_OUTCOMES = Counter(
+    "assistant_disease_jobs_total", "Disease detection jobs by outcome (done, failed or rejected).", ("result",)
+)
+
+def callback_allowed(url):
+   parsed = urlparse(url)
+   return parsed.scheme in ('http', 'https') and (parsed.hostname or '').lower() in DISEASE_CALLBACK_HOSTS
+
+def detach_upload(image_file):
+   # Werkzeug closes uploaded files when the request ends; a job outlives it
+   spool = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_BYTES)
+   shutil.copyfileobj(image_file, spool, 64 * 1024)
+   spool.seek(0)
+   return spool
+
+def send_job_callback(job):
+   try:
+       response = requests.post(job["callback_url"], json=job, timeout=10, allow_redirects=False)
+       response.raise_for_status()
+   except requests.exceptions.RequestException as e:
+       logger.warning("Disease job callback failed: %s", e, extra={"job_id": job["job_id"]})
+
+def run_disease_job(job, image_file):
+   job = dict(job, status="running", started_at=round(time.time(), 3))
+   DISEASE_JOBS.set(job["job_id"], job)
+   try:
+       with image_file:
+           message, data, status = run_disease_detection(image_file, job["language"])
+       job = dict(job, status="done", result={"message": message, "data": data, "status": status})
+   except Exception as e:
+       logger.exception("Disease job failed: %s", e, extra={"job_id": job["job_id"]})
+       message = DISEASE_MESSAGES["invalid_image"][job["language"]]
+       job = dict(job, status="failed", result={"message": message, "data": {"error": message}, "status": 500})
+   finally:
+       DISEASE_JOB_SLOTS.release()
+       DISEASE_JOBS_PENDING.dec()
+   
+   job["finished_at"] = round(time.time(), 3)
+   DISEASE_JOBS.set(job["job_id"], job)
+   DISEASE_JOB_OUTCOMES.inc(result=job["status"])
+   logger.info("Disease job finished", extra={
+       "job_id": job["job_id"], "job_status": job["status"],
+       "duration_ms": round((job["finished_at"] - job["created_at"]) * 1000, 1)
+   })
+   if job.get("callback_url"):
+       send_job_callback(job)
 
-def handle_weather_query(original_text, text_lower, language):
+def handle_weather_query(original_text, text_lower, language, location_info=None):
     try:
-        location_info = extract_location_from_command(text_lower)
+        if location_info is None:
+            location_info = extract_location_from_command(text_lower)
         
         if location_info and location_info.get('confidence', 0) >= 0.5:
             district = location_info['district']
-            coords = GUJARAT_DISTRICTS[district]
+            if 'latitude' in location_info:
+                coords = {'lat': location_info['latitude'], 'lon': location_info['longitude']}
+            else:
+                coords = GUJARAT_DISTRICTS[district]
             weather_data = get_weather_data(coords['lat'], coords['lon'])
             
             if weather_data:
@@ -1234,7 +2921,7 @@ def handle_weather_query(original_text, text_lower, language):
                     try:
                         response = translate_text(response, language)
                     except Exception as e:
-                        print(f"Weather translation failed: {e}")
+                        logger.warning("Weather translation failed: %s", e)
                 
                 return create_response(
                     "Weather information retrieved successfully",
@@ -1242,7 +2929,8 @@ def handle_weather_query(original_text, text_lower, language):
                         "type": "weather",
                         "district": district,
                         "response": response,
-                        "fuzzy_match": location_info.get('confidence', 1.0) < 0.9
+                        "fuzzy_match": location_info.get('confidence', 1.0) < 0.9,
+                        "coordinates": coords
                     },
                     status=200
                 )
@@ -1261,6 +2949,7 @@ def handle_weather_query(original_text, text_lower, language):
                 )
         
         elif location_info and location_info.get('confidence', 0) > 0.3:
+            set_intent("clarification")
             district = location_info['district']
             did_you_mean = DISTRICT_ERROR_MESSAGES["did_you_mean"][language]
             
@@ -1300,17 +2989,18 @@ def handle_weather_query(original_text, text_lower, language):
             )
             
     except Exception as e:
-        print(f"Weather query error: {str(e)}")
+        logger.exception("Weather query error: %s", e)
         return create_response(
             "Failed to process weather query",
             error=str(e),
             status=500
         )
 
-def handle_commodity_query(original_text, text_lower, language):
+def handle_commodity_query(original_text, text_lower, language, location_info=None, paging=None):
    try:
        district = None
-       location_info = extract_location_from_command(text_lower)
+       if location_info is None:
+           location_info = extract_location_from_command(text_lower)
        
        if location_info and location_info.get('confidence', 0) >= 0.5:
            district = location_info['district']
@@ -1321,16 +3011,46 @@ def handle_commodity_query(original_text, text_lower, language):
        # Detect commodity from query using enhanced extraction
        commodity_filter = extract_commodity_from_text(original_text)
        
-       return get_commodity_prices_internal(district, date_str, language, commodity_filter=commodity_filter)
+       # "Where should I sell" questions are ranked from the materialized aggregates
+       if commodity_filter and is_market_comparison_query(text_lower):
+           top_n = extract_top_n_from_text(original_text)
+           return get_market_comparison_internal(commodity_filter, date_str, language, top_n=top_n)
+       
+       paging = paging or {}
+       return get_commodity_prices_internal(
+           district, date_str, language,
+           commodity_filter=commodity_filter,
+           sort=paging.get('sort'),
+           order=paging.get('order', 'asc'),
+           page_size=paging.get('page_size', COMMODITY_PAGE_SIZE)
+       )
        
    except Exception as e:
-       print(f"Commodity query error: {str(e)}")
+       logger.exception("Commodity query error: %s", e)
        return create_response(
            "Failed to process commodity query",
            error=str(e),
            status=500
        )
 
+def handle_commodity_page(cursor, language, page_size=COMMODITY_PAGE_SIZE):
+   query, offset = decode_commodity_cursor(cursor)
+   if query is None:
+       return create_response(
+           "Invalid cursor",
+           error="The pagination cursor is malformed",
+           status=400
+       )
+   
+   return get_commodity_prices_internal(
+       query['d'], query['t'], language,
+       commodity_filter=query['c'],
+       sort=query['s'],
+       order=query['r'],
+       page_size=page_size,
+       offset=offset
+   )
+
 def handle_general_chat(text, language):
    try:
        if not is_query_allowed(text):
@@ -1351,7 +3071,7 @@ def handle_general_chat(text, language):
            try:
                text_for_claude = translate_text(text, 'en')
            except Exception as e:
-               print(f"Translation to English failed: {e}")
+               logger.warning("Translation to English failed: %s", e)
                text_for_claude = text
        else:
            text_for_claude = text
@@ -1382,19 +3102,1160 @@ def handle_general_chat(text, language):
        )
        
    except Exception as e:
-       print(f"General chat error: {str(e)}")
+       logger.exception("General chat error: %s", e)
        return create_response(
            "Failed to process chat query",
            error=str(e),
            status=500
        )
 
+# Synthesized speech is stored on disk under a content address,
+# sha256(language, voice, text), so identical phrases are synthesized once and
+# then served as static bytes. Each line of a response is cached on its own as
+# well, so the fixed lines of a weather or price report are shared between
+# responses whose numbers differ. MP3 frames concatenate cleanly.
+class AudioCache:
+    """Disk-backed LRU of audio files, bounded by total size."""
+    
+    def __init__(self, directory, max_bytes, suffix=".mp3"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Rebuild the LRU order from a previous run, oldest access first
+        existing = []
+        for filename in os.listdir(directory):
+            if filename.endswith(suffix):
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, filename[:-len(suffix)], stat.st_size))
+        for _, key, size in sorted(existing):
+            self._entries[key] = size
+            self._total_bytes += size
+    
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+    
+    def get(self, key):
+        """Path of the cached file, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+            return None
+        return path
+    
+    def read(self, key):
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as audio_file:
+                return audio_file.read()
+        except FileNotFoundError:
+            return None
+    
+    def put(self, key, audio_bytes):
+        path = self.path_for(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(audio_bytes)
+        os.replace(tmp_path, path)
+        evicted = []
+        with self._lock:
+            self._total_bytes += len(audio_bytes) - self._entries.pop(key, 0)
+            self._entries[key] = len(audio_bytes)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path_for(old_key))
+            except FileNotFoundError:
+                pass
+        return path
+    
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+# Speech engines. Each backend turns one segment of text into audio bytes in
+# its own format and knows how to join segments; TTS_BACKEND picks one at start-up.
+class TTSError(Exception):
+    pass
+
+class TTSBackend:
+    name = None
+    extension = None
+    mimetype = None
+    default_voices = {}
+    voice_pattern = re.compile(r'^[A-Za-z0-9_.+-]{1,64}$')
+    
+    def available(self):
+        return True
+    
+    def resolve_voice(self, language, requested=None):
+        if requested and self.voice_pattern.match(requested):
+            return requested
+        return self.default_voices[language]
+    
+    def synthesize(self, text, language, voice):
+        raise NotImplementedError
+    
+    def join(self, segments):
+        return b"".join(segments)
+
+class GTTSBackend(TTSBackend):
+    """Google Translate's speech endpoint via gTTS. Voices are regional front-ends (tld)."""
+    name = "gtts"
+    extension = ".mp3"
+    mimetype = "audio/mpeg"
+    default_voices = {"en": "co.in", "hi": "co.in", "gu": "co.in"}
+    voice_pattern = re.compile(r'^[a-z]{2,3}(\.[a-z]{2,3})?$')
+    
+    def synthesize(self, text, language, voice):
+        buffer = io.BytesIO()
+        with track_upstream("google_tts"):
+            gTTS(text=text, lang=language, tld=voice).write_to_fp(buffer)
+        return buffer.getvalue()
+
+class SubprocessTTSBackend(TTSBackend):
+    """A local engine run once per segment, text on stdin and WAV out."""
+    extension = ".wav"
+    mimetype = "audio/wav"
+    binary = None
+    
+    def available(self):
+        return shutil.which(self.binary) is not None
+    
+    def command(self, language, voice, output_path):
+        raise NotImplementedError
+    
+    def synthesize(self, text, language, voice):
+        fd, output_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with span(f"tts_{self.name}"):
+                result = subprocess.run(
+                    self.command(language, voice, output_path), input=text.encode('utf-8'),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=TTS_SUBPROCESS_TIMEOUT
+                )
+            if result.returncode != 0:
+                raise TTSError(f"{self.name} exited with {result.returncode}: "
+                               f"{result.stderr.decode('utf-8', 'replace').strip()[:200]}")
+            with open(output_path, 'rb') as output_file:
+                return output_file.read()
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise TTSError(f"{self.name} failed: {e}") from e
+        finally:
+            try:
+                os.remove(output_path)
+            except FileNotFoundError:
+                pass
+    
+    def join(self, segments):
+        # WAV segments can't simply be concatenated; rewrite one file with all
+        # the frames (every segment comes from the same engine and voice).
+        if len(segments) == 1:
+            return segments[0]
+        output = io.BytesIO()
+        writer = None
+        for segment in segments:
+            with wave.open(io.BytesIO(segment), 'rb') as reader:
+                if writer is None:
+                    writer = wave.open(output, 'wb')
+                    writer.setparams(reader.getparams())
+                writer.writeframes(reader.readframes(reader.getnframes()))
+        writer.close()
+        return output.getvalue()
+
+class EspeakBackend(SubprocessTTSBackend):
+    """espeak-ng formant synthesis: robotic, but on-box, fast and covers hi and gu."""
+    name = "espeak"
+    binary = ESPEAK_BINARY
+    default_voices = {"en": "en-us", "hi": "hi", "gu": "gu"}
+    
+    def command(self, language, voice, output_path):
+        return [self.binary, "--stdin", "-v", voice, "-s", str(ESPEAK_SPEED_WPM), "-w", output_path]
+
+class PiperBackend(SubprocessTTSBackend):
+    """Piper neural voices. Voices are ONNX models configured per language in PIPER_MODELS."""
+    name = "piper"
+    binary = PIPER_BINARY
+    
+    def __init__(self, models=PIPER_MODELS):
+        self.default_voices = {}
+        for pair in models.split(','):
+            language, _, model = pair.partition('=')
+            if language.strip() and model.strip():
+                self.default_voices[language.strip()] = model.strip()
+    
+    def available(self):
+        return super().available() and bool(self.default_voices)
+    
+    def resolve_voice(self, language, requested=None):
+        # Clients never choose a model path
+        voice = self.default_voices.get(language)
+        if voice is None:
+            raise TTSError(f"no piper model configured for {language}")
+        return voice
+    
+    def command(self, language, voice, output_path):
+        return [self.binary, "--model", voice, "--output_file", output_path]
+
+TTS_BACKENDS = {backend.name: backend for backend in (GTTSBackend, EspeakBackend, PiperBackend)}
+
+def create_tts_backend(name=TTS_BACKEND_NAME):
+   if name not in TTS_BACKENDS:
+       logger.warning("Unknown TTS_BACKEND %r, using gtts", name)
+       name = "gtts"
+   backend = TTS_BACKENDS[name]()
+   if not backend.available():
+       logger.warning("TTS backend %s is not available on this host; speech requests will fail", name)
+   return backend
+
+TTS_BACKEND = create_tts_backend()
+# One directory per backend, since each produces its own audio format
+AUDIO_CACHE = AudioCache(os.path.join(AUDIO_CACHE_DIR, TTS_BACKEND.name), AUDIO_CACHE_MAX_BYTES,
+                         suffix=TTS_BACKEND.extension)
+AUDIO_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+TTS_SEGMENTS = Counter(
+    "assistant_tts_segments_total", "Speech segments served, by backend and cache result.", ("backend", "result")
+)
+
+def normalize_speech_text(text):
+   return re.sub(r'\s+', ' ', text).strip()
+
+def audio_cache_key(text, language, voice):
+   identity = f"{TTS_BACKEND.name}\0{language}\0{voice}\0{normalize_speech_text(text)}"
+   return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+def split_speech_segments(text):
+   return [line for line in (normalize_speech_text(line) for line in text.splitlines()) if line]
+
+# The fixed localized messages are rendered once into a single bundle: one
+# binary file of concatenated audio plus a JSON index of (offset, length) by
+# cache key. The bundle is mmapped, so lookups are a slice and need no TTS call.
+AUDIO_CATALOGUE_BUNDLE = "audio_catalogue.bin"
+AUDIO_CATALOGUE_INDEX = "audio_catalogue.json"
+
+class AudioCatalogue:
+    def __init__(self, entries=None, bundle=None, backend=None):
+        self.entries = entries or {}
+        self.bundle = bundle
+        self.backend = backend
+    
+    @classmethod
+    def load(cls, directory):
+        index_path = os.path.join(directory, AUDIO_CATALOGUE_INDEX)
+        try:
+            with open(index_path, encoding='utf-8') as index_file:
+                index = json.load(index_file)
+            with open(os.path.join(directory, AUDIO_CATALOGUE_BUNDLE), 'rb') as bundle_file:
+                bundle = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ) if index["entries"] else None
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Audio catalogue in %s is unreadable: %s", directory, e)
+            return cls()
+        if index.get("backend") != TTS_BACKEND.name:
+            logger.info("Audio catalogue was rendered by %s, not %s; ignoring it", index.get("backend"), TTS_BACKEND.name)
+            return cls()
+        return cls(index["entries"], bundle, index["backend"])
+    
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return self.bundle[entry["offset"]:entry["offset"] + entry["length"]]
+    
+    def __contains__(self, key):
+        return key in self.entries
+    
+    def __len__(self):
+        return len(self.entries)
+
+def audio_catalogue_messages():
+   """(language, text) for every fixed message a voice response can consist of."""
+   messages = []
+   for language in ('en', 'hi', 'gu'):
+       for group in (DISEASE_MESSAGES, DISTRICT_ERROR_MESSAGES, VOICE_MESSAGES):
+           messages.extend((language, variants[language]) for variants in group.values())
+       messages.append((language, RESTRICTED_QUERY_RESPONSE[language]))
+       messages.append((language, ", ".join(get_popular_districts_list(language))))
+   # /voice_session speaks an answer sentence by sentence, so multi-sentence
+   # messages are also rendered per sentence
+   sentences = [
+       (language, sentence) for language, text in messages
+       for sentence in split_speech_sentences(text) if sentence != normalize_speech_text(text)
+   ]
+   return messages + sentences
+
+def missing_catalogue_messages(catalogue=None):
+   catalogue = catalogue if catalogue is not None else AUDIO_CATALOGUE
+   return [
+       (language, text) for language, text in audio_catalogue_messages()
+       if audio_cache_key(text, language, TTS_BACKEND.resolve_voice(language)) not in catalogue
+   ]
+
+def build_audio_catalogue(directory=AUDIO_CATALOGUE_DIR):
+   """
+   Render every catalogue message with the configured backend and write the
+   bundle and index. Audio already in the current catalogue or the audio cache
+   is reused, so a rebuild after adding a message only synthesizes that message.
+   """
+   global AUDIO_CATALOGUE
+   os.makedirs(directory, exist_ok=True)
+   existing = AUDIO_CATALOGUE
+   entries = {}
+   bundle = io.BytesIO()
+   for language, text in audio_catalogue_messages():
+       voice = TTS_BACKEND.resolve_voice(language)
+       key = audio_cache_key(text, language, voice)
+       if key in entries:
+           continue
+       audio_bytes = existing.get(key) or AUDIO_CACHE.read(key) or TTS_BACKEND.synthesize(text, language, voice)
+       entries[key] = {"offset": bundle.tell(), "length": len(audio_bytes), "language": language, "text": text}
+       bundle.write(audio_bytes)
+   
+   # Bundle first, index last: a reader never sees an index pointing past the bundle
+   for filename, content in ((AUDIO_CATALOGUE_BUNDLE, bundle.getvalue()), (AUDIO_CATALOGUE_INDEX, json.dumps({
+       "backend": TTS_BACKEND.name,
+       "format": TTS_BACKEND.extension.lstrip('.'),
+       "built_at": datetime.now().isoformat(timespec='seconds'),
+       "entries": entries
+   }, ensure_ascii=False, indent=1).encode('utf-8'))):
+       fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+       with os.fdopen(fd, 'wb') as tmp_file:
+           tmp_file.write(content)
+       os.replace(tmp_path, os.path.join(directory, filename))
+   
+   AUDIO_CATALOGUE = AudioCatalogue.load(directory)
+   logger.info("Audio catalogue built", extra={"entries": len(entries), "bytes": bundle.tell()})
+   return len(entries)
+
+AUDIO_CATALOGUE = AudioCatalogue.load(AUDIO_CATALOGUE_DIR)
+
+def read_audio(key):
+   audio_bytes = AUDIO_CATALOGUE.get(key)
+   if audio_bytes is not None:
+       return audio_bytes
+   return AUDIO_CACHE.read(key)
+
+def synthesize_segment(text, language, voice):
+   key = audio_cache_key(text, language, voice)
+   audio_bytes = AUDIO_CATALOGUE.get(key)
+   if audio_bytes is not None:
+       TTS_SEGMENTS.inc(backend=TTS_BACKEND.name, result="catalogue")
+       return audio_bytes
+   audio_bytes = AUDIO_CACHE.read(key)
+   if audio_bytes is not None:
+       TTS_SEGMENTS.inc(backend=TTS_BACKEND.name, result="hit")
+       return audio_bytes
+   TTS_SEGMENTS.inc(backend=TTS_BACKEND.name, result="miss")
+   audio_bytes = TTS_BACKEND.synthesize(text, language, voice)
+   AUDIO_CACHE.put(key, audio_bytes)
+   return audio_bytes
+
+@traced("tts")
+def synthesize_speech(text, language, voice=None):
+   """
+   Returns (key, cached) for the speech of the whole text. The audio itself is
+   read back from AUDIO_CACHE by key.
+   """
+   voice = TTS_BACKEND.resolve_voice(language, voice)
+   key = audio_cache_key(text, language, voice)
+   if key in AUDIO_CATALOGUE:
+       TTS_SEGMENTS.inc(backend=TTS_BACKEND.name, result="catalogue")
+       return key, True
+   if AUDIO_CACHE.get(key) is not None:
+       TTS_SEGMENTS.inc(backend=TTS_BACKEND.name, result="hit")
+       return key, True
+   segments = split_speech_segments(text)
+   audio_bytes = TTS_BACKEND.join([synthesize_segment(segment, language, voice) for segment in segments])
+   AUDIO_CACHE.put(key, audio_bytes)
+   return key, False
+
+# Speech recognition. Uploaded audio (usually webm/opus from MediaRecorder) is
+# decoded and resampled to 16 kHz mono PCM WAV by piping it through ffmpeg;
+# recognizers all take that one format.
+class AudioDecodeError(Exception):
+    pass
+
+class STTError(Exception):
+    pass
+
+def ffmpeg_available():
+   return shutil.which(FFMPEG_BINARY) is not None
+
+def run_ffmpeg(input_bytes, output_args, input_args=()):
+   """Pipe bytes through ffmpeg and return stdout; all I/O stays in memory."""
+   command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", *input_args, "-i", "pipe:0", *output_args, "pipe:1"]
+   try:
+       with span("ffmpeg"):
+           result = subprocess.run(command, input=input_bytes, capture_output=True, timeout=FFMPEG_TIMEOUT)
+   except (OSError, subprocess.TimeoutExpired) as e:
+       raise AudioDecodeError(f"ffmpeg failed: {e}") from e
+   if result.returncode != 0 or not result.stdout:
+       raise AudioDecodeError(f"ffmpeg could not decode the audio: {result.stderr.decode('utf-8', 'replace').strip()[:200]}")
+   return result.stdout
+
+def is_recognizer_ready_wav(audio_bytes):
+   if audio_bytes[:4] != b'RIFF' or audio_bytes[8:12] != b'WAVE':
+       return False
+   try:
+       with wave.open(io.BytesIO(audio_bytes), 'rb') as reader:
+           return (reader.getnchannels(), reader.getsampwidth(), reader.getframerate()) == (1, 2, STT_SAMPLE_RATE)
+   except (wave.Error, EOFError):
+       return False
+
+def decode_audio_to_wav(audio_bytes):
+   """16 kHz mono 16-bit WAV, truncated to STT_MAX_SECONDS."""
+   if is_recognizer_ready_wav(audio_bytes):
+       return audio_bytes
+   if not ffmpeg_available():
+       raise AudioDecodeError("Audio must be 16 kHz mono WAV when ffmpeg is not installed")
+   # Raw PCM out, wrapped here: a WAV header written to a pipe has no valid sizes
+   pcm = run_ffmpeg(audio_bytes, [
+       "-vn", "-ac", "1", "-ar", str(STT_SAMPLE_RATE), "-t", str(STT_MAX_SECONDS), "-f", "s16le"
+   ])
+   output = io.BytesIO()
+   with wave.open(output, 'wb') as writer:
+       writer.setnchannels(1)
+       writer.setsampwidth(2)
+       writer.setframerate(STT_SAMPLE_RATE)
+       writer.writeframes(pcm)
+   return output.getvalue()
+
+def wav_pcm_frames(wav_bytes):
+   with wave.open(io.BytesIO(wav_bytes), 'rb') as reader:
+       return reader.readframes(reader.getnframes())
+
+class BufferedSTTStream:
+    """Streaming adapter for recognizers that only take whole utterances."""
+    
+    def __init__(self, backend, language):
+        self.backend = backend
+        self.language = language
+        self._pcm = bytearray()
+    
+    def accept(self, pcm):
+        """Feed PCM; returns ("partial" | "final", text) when the recognizer has news, else None."""
+        self._pcm.extend(pcm)
+        return None
+    
+    def finish(self):
+        if not self._pcm:
+            return ""
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(STT_SAMPLE_RATE)
+            writer.writeframes(bytes(self._pcm))
+        return self.backend.transcribe(output.getvalue(), self.language)
+
+class STTBackend:
+    name = None
+    languages = ("en", "hi", "gu")
+    
+    def available(self):
+        return True
+    
+    def open_stream(self, language):
+        return BufferedSTTStream(self, language)
+    
+    def transcribe(self, wav_bytes, language):
+        """Transcript of 16 kHz mono WAV, or "" when nothing intelligible was said."""
+        raise NotImplementedError
+    
+    def _audio_data(self, wav_bytes):
+        return sr.AudioData(wav_pcm_frames(wav_bytes), STT_SAMPLE_RATE, 2)
+
+class GoogleSTTBackend(STTBackend):
+    """Google's free web speech endpoint through SpeechRecognition."""
+    name = "google"
+    language_tags = {"en": "en-IN", "hi": "hi-IN", "gu": "gu-IN"}
+    
+    def transcribe(self, wav_bytes, language):
+        recognizer = sr.Recognizer()
+        try:
+            with track_upstream("google_stt"):
+                try:
+                    return recognizer.recognize_google(self._audio_data(wav_bytes), language=self.language_tags[language])
+                except sr.UnknownValueError:
+                    # No speech heard is an answer, not an upstream failure
+                    return ""
+        except CircuitOpenError as e:
+            raise STTError(str(e)) from e
+        except sr.RequestError as e:
+            raise STTError(f"Google speech recognition failed: {e}") from e
+
+class SphinxSTTBackend(STTBackend):
+    """CMU PocketSphinx, fully offline; its stock model is English only."""
+    name = "sphinx"
+    languages = ("en",)
+    
+    def available(self):
+        return importlib.util.find_spec("pocketsphinx") is not None
+    
+    def transcribe(self, wav_bytes, language):
+        try:
+            with span("stt_sphinx"):
+                return sr.Recognizer().recognize_sphinx(self._audio_data(wav_bytes))
+        except sr.UnknownValueError:
+            return ""
+        except sr.RequestError as e:
+            raise STTError(f"Sphinx recognition failed: {e}") from e
+
+class VoskSTTStream:
+    """Incremental vosk recognition; an endpointed utterance comes back as "final"."""
+    
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+    
+    def accept(self, pcm):
+        if self.recognizer.AcceptWaveform(pcm):
+            return "final", json.loads(self.recognizer.Result()).get("text", "")
+        return "partial", json.loads(self.recognizer.PartialResult()).get("partial", "")
+    
+    def finish(self):
+        return json.loads(self.recognizer.FinalResult()).get("text", "")
+
+class VoskSTTBackend(STTBackend):
+    """Kaldi models through vosk, offline. Models are configured per language in VOSK_MODELS."""
+    name = "vosk"
+    
+    def __init__(self, models=VOSK_MODELS):
+        self.model_paths = {}
+        for pair in models.split(','):
+            language, _, path = pair.partition('=')
+            if language.strip() and path.strip():
+                self.model_paths[language.strip()] = path.strip()
+        self.languages = tuple(self.model_paths)
+        self._models = {}
+        self._lock = threading.Lock()
+    
+    def available(self):
+        return importlib.util.find_spec("vosk") is not None and bool(self.model_paths)
+    
+    def model(self, language):
+        # Models are hundreds of MB; load each once and share it across threads
+        if language not in self._models:
+            with self._lock:
+                if language not in self._models:
+                    self._models[language] = vosk.Model(self.model_paths[language])
+        return self._models[language]
+    
+    def recognizer(self, language):
+        return vosk.KaldiRecognizer(self.model(language), STT_SAMPLE_RATE)
+    
+    def open_stream(self, language):
+        if language not in self.model_paths:
+            raise STTError(f"no vosk model configured for {language}")
+        return VoskSTTStream(self.recognizer(language))
+    
+    def transcribe(self, wav_bytes, language):
+        if language not in self.model_paths:
+            raise STTError(f"no vosk model configured for {language}")
+        with span("stt_vosk"):
+            recognizer = self.recognizer(language)
+            recognizer.AcceptWaveform(wav_pcm_frames(wav_bytes))
+            return json.loads(recognizer.FinalResult()).get("text", "")
+
+STT_BACKENDS = {backend.name: backend for backend in (GoogleSTTBackend, SphinxSTTBackend, VoskSTTBackend)}
+
+def create_stt_backend(name=STT_BACKEND_NAME):
+   if name not in STT_BACKENDS:
+       logger.warning("Unknown STT_BACKEND %r, using google", name)
+       name = "google"
+   backend = STT_BACKENDS[name]()
+   if not backend.available():
+       logger.warning("STT backend %s is not available on this host; voice queries will fail", name)
+   return backend
+
+STT_BACKEND = create_stt_backend()
+
+@traced("stt")
+def transcribe_audio(audio_bytes, language):
+   if language not in STT_BACKEND.languages:
+       raise STTError(f"{STT_BACKEND.name} recognizer does not support {language}")
+   wav_bytes = decode_audio_to_wav(audio_bytes)
+   return normalize_speech_text(STT_BACKEND.transcribe(wav_bytes, language))
+
+def read_uploaded_audio(data):
+   """Audio bytes from a multipart upload, a raw audio/* body or base64 in JSON."""
+   upload = request.files.get('audio') or request.files.get('file')
+   if upload is not None:
+       audio_bytes = upload.read(STT_MAX_AUDIO_BYTES + 1)
+   elif request.mimetype and request.mimetype.startswith('audio/'):
+       # Read straight from the stream, at most one byte past the limit
+       audio_bytes = request.stream.read(STT_MAX_AUDIO_BYTES + 1)
+   elif data.get('audio'):
+       encoded = str(data['audio'])
+       if ',' in encoded[:100]:
+           encoded = encoded.split(',', 1)[1]
+       if len(encoded) > STT_MAX_AUDIO_BYTES * 4 // 3 + 4:
+           raise ValueError("Audio is too large")
+       try:
+           audio_bytes = base64.b64decode(encoded)
+       except (ValueError, TypeError):
+           raise ValueError("Failed to decode base64 audio")
+   else:
+       return None
+   if len(audio_bytes) > STT_MAX_AUDIO_BYTES:
+       raise ValueError("Audio is too large")
+   return audio_bytes
+
+# Compressed variants for slow links. Every variant is mono 16 kHz at a fixed
+# bitrate, transcoded once per (audio key, variant) and kept in its own cache,
+# so the same answer is never re-encoded. Without ffmpeg the original is served.
+AUDIO_FORMATS = {
+    "opus": {
+        "extension": ".ogg", "mimetype": "audio/ogg",
+        "codec": ["-c:a", "libopus", "-application", "voip", "-f", "ogg"],
+        "bitrates": (8, 12, 16, 24, 32), "default_kbps": 16, "low_kbps": 12
+    },
+    "mp3": {
+        "extension": ".mp3", "mimetype": "audio/mpeg",
+        "codec": ["-c:a", "libmp3lame", "-f", "mp3"],
+        "bitrates": (16, 24, 32, 48, 64), "default_kbps": 32, "low_kbps": 24
+    }
+}
+SLOW_CONNECTION_TYPES = ('slow-2g', '2g')
+VARIANT_PATTERN = re.compile(r'^(opus|mp3)-(\d+)k$')
+AUDIO_VARIANTS = {f"{name}-{kbps}k" for name, audio_format in AUDIO_FORMATS.items() for kbps in audio_format["bitrates"]}
+VARIANT_CACHES = {}
+VARIANT_CACHES_LOCK = threading.Lock()
+TRANSCODE_LOCKS = [threading.Lock() for _ in range(16)]
+AUDIO_TRANSCODES = Counter(
+    "assistant_audio_transcodes_total", "Audio variant lookups by variant and cache result.", ("variant", "result")
+)
+
+def negotiate_audio_variant(options, headers):
+   """
+   Pick an encoding from an explicit format/bitrate option, else the Accept
+   header. Save-Data and 2G client hints choose the format's low bitrate.
+   Returns a variant name such as "opus-12k", or None for the original audio.
+   """
+   requested = str(options.get('format') or '').lower()
+   if not requested:
+       accept = headers.get('Accept', '').lower()
+       if 'opus' in accept or 'audio/ogg' in accept or 'audio/webm' in accept:
+           requested = "opus"
+   if requested not in AUDIO_FORMATS:
+       return None
+   audio_format = AUDIO_FORMATS[requested]
+   slow = headers.get('Save-Data', '').lower() == 'on' or headers.get('ECT', '').lower() in SLOW_CONNECTION_TYPES
+   try:
+       kbps = int(options.get('bitrate') or (audio_format["low_kbps"] if slow else audio_format["default_kbps"]))
+   except (TypeError, ValueError):
+       kbps = audio_format["default_kbps"]
+   # Snap to the nearest supported bitrate that does not exceed the request
+   allowed = [rate for rate in audio_format["bitrates"] if rate <= kbps] or [audio_format["bitrates"][0]]
+   return f"{requested}-{allowed[-1]}k"
+
+def variant_cache(variant):
+   cache = VARIANT_CACHES.get(variant)
+   if cache is None:
+       with VARIANT_CACHES_LOCK:
+           cache = VARIANT_CACHES.get(variant)
+           if cache is None:
+               audio_format = AUDIO_FORMATS[VARIANT_PATTERN.match(variant).group(1)]
+               cache = VARIANT_CACHES[variant] = AudioCache(
+                   os.path.join(AUDIO_CACHE_DIR, f"{TTS_BACKEND.name}-{variant}"), AUDIO_VARIANT_CACHE_MAX_BYTES,
+                   suffix=audio_format["extension"]
+               )
+   return cache
+
+def transcode_audio(key, variant):
+   """
+   (audio bytes, variant, mimetype) for a cached audio key; the variant is None
+   when the original is returned because no transcode is possible.
+   """
+   if variant is None or not ffmpeg_available():
+       return read_audio(key), None, TTS_BACKEND.mimetype
+   audio_format_name, kbps = VARIANT_PATTERN.match(variant).groups()
+   audio_format = AUDIO_FORMATS[audio_format_name]
+   cache = variant_cache(variant)
+   audio_bytes = cache.read(key)
+   if audio_bytes is not None:
+       AUDIO_TRANSCODES.inc(variant=variant, result="hit")
+       return audio_bytes, variant, audio_format["mimetype"]
+   
+   # Striped locks: concurrent requests for the same answer wait for one encode
+   with TRANSCODE_LOCKS[int(key[:8], 16) % len(TRANSCODE_LOCKS)]:
+       audio_bytes = cache.read(key)
+       if audio_bytes is None:
+           source = read_audio(key)
+           if source is None:
+               return None, None, TTS_BACKEND.mimetype
+           AUDIO_TRANSCODES.inc(variant=variant, result="miss")
+           audio_bytes = run_ffmpeg(source, ["-vn", "-ac", "1", "-ar", str(STT_SAMPLE_RATE),
+                                             "-b:a", f"{kbps}k", *audio_format["codec"]])
+           cache.put(key, audio_bytes)
+       else:
+           AUDIO_TRANSCODES.inc(variant=variant, result="hit")
+   return audio_bytes, variant, audio_format["mimetype"]
+
+def audio_url(key, variant=None):
+   return f"/audio/{key}?variant={variant}" if variant else f"/audio/{key}"
+
+# Streaming voice sessions. Audio is read from a chunked request body and fed
+# to the recognizer as it arrives; once the recognizer endpoints an utterance,
+# routing starts speculatively while the rest of the audio is still coming in.
+# The answer is synthesized sentence by sentence on VOICE_EXECUTOR and every
+# stage is reported as one NDJSON event, so a client can start playback after
+# the first sentence rather than after the whole turn.
+VOICE_EXECUTOR = ThreadPoolExecutor(max_workers=VOICE_SESSION_WORKERS, thread_name_prefix="voice")
+RAW_PCM_MIMETYPES = ('audio/l16', 'audio/pcm', 'audio/x-raw')
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?।])\s+|\n+')
+
+def split_speech_sentences(text):
+   return [sentence for sentence in (normalize_speech_text(part) for part in SENTENCE_BOUNDARY.split(text)) if sentence]
+
+def iter_request_chunks(stream, limit=STT_MAX_AUDIO_BYTES):
+   received = 0
+   while True:
+       chunk = stream.read(VOICE_CHUNK_BYTES)
+       if not chunk:
+           return
+       received += len(chunk)
+       if received > limit:
+           raise AudioDecodeError("Audio is too large")
+       yield chunk
+
+def iter_pcm_chunks(stream, mimetype):
+   """16 kHz mono s16le PCM from a streamed request body, decoded as it arrives."""
+   max_pcm_bytes = STT_MAX_SECONDS * STT_SAMPLE_RATE * 2
+   if mimetype in RAW_PCM_MIMETYPES:
+       # Keep chunks sample-aligned
+       carry = b""
+       sent = 0
+       for chunk in iter_request_chunks(stream):
+           chunk = carry + chunk
+           usable = len(chunk) - len(chunk) % 2
+           carry = chunk[usable:]
+           if sent + usable > max_pcm_bytes:
+               yield chunk[:max_pcm_bytes - sent]
+               return
+           sent += usable
+           yield chunk[:usable]
+       return
+   
+   if not ffmpeg_available():
+       # No streaming decoder; take the whole body and decode it in one go
+       wav_bytes = decode_audio_to_wav(b"".join(iter_request_chunks(stream)))
+       yield wav_pcm_frames(wav_bytes)
+       return
+   
+   process = subprocess.Popen(
+       [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+        "-vn", "-ac", "1", "-ar", str(STT_SAMPLE_RATE), "-t", str(STT_MAX_SECONDS), "-f", "s16le", "pipe:1"],
+       stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+   )
+   feed_error = []
+   
+   def feed():
+       try:
+           for chunk in iter_request_chunks(stream):
+               process.stdin.write(chunk)
+       except (AudioDecodeError, OSError) as e:
+           feed_error.append(e)
+       finally:
+           try:
+               process.stdin.close()
+           except OSError:
+               pass
+   
+   # Writing and reading on one thread would deadlock once ffmpeg's stdout pipe fills
+   feeder = threading.Thread(target=feed, name="voice-feed", daemon=True)
+   feeder.start()
+   produced = False
+   try:
+       while True:
+           pcm = process.stdout.read1(VOICE_CHUNK_BYTES)
+           if not pcm:
+               break
+           produced = True
+           yield pcm
+   finally:
+       feeder.join(timeout=FFMPEG_TIMEOUT)
+       if process.poll() is None:
+           process.kill()
+       process.wait()
+   if feed_error and isinstance(feed_error[0], AudioDecodeError):
+       raise feed_error[0]
+   if not produced:
+       raise AudioDecodeError("ffmpeg could not decode the audio")
+
+def speak_sentence(sentence, language, voice, variant=None):
+   audio_bytes = synthesize_segment(sentence, language, voice)
+   key = audio_cache_key(sentence, language, voice)
+   if variant:
+       try:
+           transcoded, variant, mimetype = transcode_audio(key, variant)
+           if transcoded is not None:
+               return key, transcoded, variant, mimetype
+       except AudioDecodeError as e:
+           logger.warning("Audio transcode failed, sending the original: %s", e, extra={"variant": variant})
+   return key, audio_bytes, None, TTS_BACKEND.mimetype
+
+def voice_event(started, name, **fields):
+   fields = {"event": name, "t_ms": round((time.perf_counter() - started) * 1000, 1), **fields}
+   return json.dumps(fields, ensure_ascii=False) + "\n"
+
+def run_voice_session(stream, mimetype, language, location_info=None, speak=True, variant=None):
+   started = time.perf_counter()
+   
+   # The copied request context gets a fresh g, so the request id and span
+   # list are carried over by hand and the routed intent is handed back
+   carried = {name: g.get(name) for name in ('request_id', 'request_started', 'spans', 'want_timings')}
+   
+   def submit_route(text):
+       @copy_current_request_context
+       def route():
+           for name, value in carried.items():
+               setattr(g, name, value)
+           return route_text_query(text, language, location_info=location_info), g.get('intent')
+       return VOICE_EXECUTOR.submit(route)
+   
+   utterances = []
+   speculative = None
+   last_partial = ""
+   try:
+       recognizer = STT_BACKEND.open_stream(language)
+       for pcm in iter_pcm_chunks(stream, mimetype):
+           result = recognizer.accept(pcm)
+           if not result:
+               continue
+           kind, text = result
+           if kind == "partial" and text and text != last_partial:
+               last_partial = text
+               yield voice_event(started, "partial", text=text)
+           elif kind == "final" and text:
+               utterances.append(text)
+               transcript_so_far = normalize_speech_text(" ".join(utterances))
+               yield voice_event(started, "utterance", text=text)
+               # Only the newest transcript can still be answered; an older
+               # route that hasn't started yet gives its worker back
+               if speculative is not None:
+                   speculative[1].cancel()
+               speculative = (transcript_so_far, submit_route(transcript_so_far))
+       tail = recognizer.finish()
+       if tail:
+           utterances.append(tail)
+   except AudioDecodeError as e:
+       yield voice_event(started, "error", stage="decode", error=str(e))
+       return
+   except STTError as e:
+       logger.error("Streaming speech recognition failed: %s", e, extra={"language": language})
+       yield voice_event(started, "error", stage="stt", error="Unable to transcribe audio")
+       return
+   
+   transcript = normalize_speech_text(" ".join(utterances))
+   if not transcript:
+       yield voice_event(started, "error", stage="stt", error=VOICE_MESSAGES["no_speech"][language])
+       return
+   yield voice_event(started, "transcript", text=transcript)
+   
+   # Later speech changed the question: the speculative answer is dropped
+   reused = speculative is not None and speculative[0] == transcript
+   if speculative is not None and not reused:
+       speculative[1].cancel()
+   future = speculative[1] if reused else submit_route(transcript)
+   try:
+       (response, status), intent = future.result()
+       set_intent(intent)
+       payload = response.get_json()
+   except Exception as e:
+       logger.exception("Voice session routing failed: %s", e)
+       yield voice_event(started, "error", stage="route", error="Failed to process request")
+       return
+   data = payload.get("data") or {}
+   yield voice_event(started, "response", status=status, message=payload.get("message"), data=data, speculative=reused)
+   
+   answer = data.get("response") or data.get("error")
+   sentences = split_speech_sentences(answer) if speak and isinstance(answer, str) else []
+   if sentences:
+       try:
+           voice = TTS_BACKEND.resolve_voice(language)
+       except TTSError as e:
+           yield voice_event(started, "error", stage="tts", error=str(e))
+           return
+       futures = [VOICE_EXECUTOR.submit(speak_sentence, sentence, language, voice, variant) for sentence in sentences]
+       for index, (sentence, future) in enumerate(zip(sentences, futures)):
+           try:
+               key, audio_bytes, sentence_variant, audio_mimetype = future.result()
+           except Exception as e:
+               logger.warning("Voice session TTS failed: %s", e, extra={"language": language})
+               yield voice_event(started, "error", stage="tts", index=index, error="Unable to generate speech")
+               continue
+           yield voice_event(
+               started, "audio", index=index, text=sentence, mimetype=audio_mimetype,
+               audio_url=audio_url(key, sentence_variant),
+               audio=base64.b64encode(audio_bytes).decode('ascii')
+           )
+   yield voice_event(started, "done", sentences=len(sentences))
+
+def is_admin_request():
+   if not ADMIN_TOKEN:
+       return False
+   supplied = request.headers.get('X-Admin-Token', '')
+   auth_header = request.headers.get('Authorization', '')
+   if auth_header.startswith('Bearer '):
+       supplied = auth_header[len('Bearer '):]
+   return hmac.compare_digest(supplied.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+def admin_required(view):
+   @wraps(view)
+   def wrapper(*args, **kwargs):
+       if not is_admin_request():
+           return create_response("Unauthorized", error="A valid admin token is required", status=401)
+       return view(*args, **kwargs)
+   return wrapper
+
+# Opt-in per-request profiling: an admin sends X-Profile: 1 (or ?profile=1) and
+# the request runs under cProfile. Captures are capped by PROFILE_MAX_CAPTURES;
+# delete old ones through the admin endpoint to make room.
+PROFILE_LOCK = threading.Lock()
+PROFILE_SLOTS_USED = 0
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}_[0-9a-f]{32}$')
+
+def _profile_path(profile_id, suffix):
+   return os.path.join(PROFILE_DIR, f"{profile_id}{suffix}")
+
+def list_profiles():
+   if not os.path.isdir(PROFILE_DIR):
+       return []
+   profiles = []
+   for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+       if not name.endswith('.json'):
+           continue
+       try:
+           with open(os.path.join(PROFILE_DIR, name), encoding='utf-8') as meta_file:
+               profiles.append(json.load(meta_file))
+       except (OSError, ValueError):
+           continue
+   return profiles
+
+def _reserve_profile_slot():
+   global PROFILE_SLOTS_USED
+   with PROFILE_LOCK:
+       if PROFILE_SLOTS_USED == 0:
+           PROFILE_SLOTS_USED = len(list_profiles())
+       if PROFILE_SLOTS_USED >= PROFILE_MAX_CAPTURES:
+           return False
+       PROFILE_SLOTS_USED += 1
+       return True
+
+def _release_profile_slot():
+   global PROFILE_SLOTS_USED
+   with PROFILE_LOCK:
+       PROFILE_SLOTS_USED = max(0, PROFILE_SLOTS_USED - 1)
+
+def save_profile(profiler, duration):
+   os.makedirs(PROFILE_DIR, exist_ok=True)
+   profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex}"
+   profiler.dump_stats(_profile_path(profile_id, '.prof'))
+   metadata = {
+       "id": profile_id,
+       "request_id": g.request_id,
+       "method": request.method,
+       "path": request.path,
+       "intent": g.intent,
+       "duration_ms": round(duration * 1000, 2),
+       "captured_at": datetime.now().isoformat(timespec="seconds")
+   }
+   with open(_profile_path(profile_id, '.json'), 'w', encoding='utf-8') as meta_file:
+       json.dump(metadata, meta_file)
+   return profile_id
+
+def approximate_size(obj, seen=None):
+   """Deep sys.getsizeof over containers; shared objects are counted once."""
+   if seen is None:
+       seen = set()
+   stack = [obj]
+   total = 0
+   while stack:
+       current = stack.pop()
+       if id(current) in seen:
+           continue
+       seen.add(id(current))
+       total += sys.getsizeof(current)
+       if isinstance(current, dict):
+           stack.extend(current.keys())
+           stack.extend(current.values())
+       elif isinstance(current, (list, tuple, set, frozenset)):
+           stack.extend(current)
+   return total
+
+def current_rss_bytes():
+   try:
+       with open('/proc/self/statm') as statm:
+           return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+   except (OSError, ValueError, IndexError):
+       return None
+
+def collect_cache_sizes():
+   sizes = {}
+   seen = set()
+   for name, cache in CACHES.items():
+       items = cache.items()
+       sizes[name] = {"entries": len(items), "approx_bytes": approximate_size(items, seen)}
+   # Copies of the containers ingest mutates are taken under the lock, so price
+   # requests only wait for the copy; the deep walk runs outside it
+   with ARRIVALS_LOCK:
+       stores = {
+           "arrivals_store": dict(ARRIVALS_STORE),
+           "arrival_keys": set(ARRIVAL_KEYS),
+           "commodity_aggregates": {
+               key: {"districts": dict(bucket["districts"]), "ranking": list(bucket["ranking"])}
+               for key, bucket in COMMODITY_AGGREGATES.items()
+           },
+           "arrival_dates": {key: list(dates) for key, dates in ARRIVAL_DATES.items()}
+       }
+   for name, store in stores.items():
+       sizes[name] = {"entries": len(store), "approx_bytes": approximate_size(store, seen)}
+   lru_info = canonical_commodity.cache_info()
+   sizes["canonical_commodity"] = {"entries": lru_info.currsize, "approx_bytes": None}
+   return sizes
+
+# tracemalloc snapshots taken on demand; the two most recent are kept so the
+# newest can be diffed against the previous one.
+MEMORY_SNAPSHOTS = []
+MEMORY_SNAPSHOT_LOCK = threading.Lock()
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+
+def take_memory_snapshot():
+   with MEMORY_SNAPSHOT_LOCK:
+       if not tracemalloc.is_tracing():
+           tracemalloc.start(TRACEMALLOC_FRAMES)
+       snapshot = tracemalloc.take_snapshot().filter_traces((
+           tracemalloc.Filter(False, tracemalloc.__file__),
+           tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+       ))
+       MEMORY_SNAPSHOTS.append((datetime.now().isoformat(timespec="seconds"), snapshot))
+       del MEMORY_SNAPSHOTS[:-2]
+       return len(MEMORY_SNAPSHOTS)
+
+def _format_stat(stat, key_type):
+   frame = stat.traceback[0]
+   entry = {
+       "location": f"{frame.filename}:{frame.lineno}" if key_type == 'lineno' else frame.filename,
+       "size_bytes": stat.size,
+       "count": stat.count
+   }
+   if hasattr(stat, 'size_diff'):
+       entry["size_diff_bytes"] = stat.size_diff
+       entry["count_diff"] = stat.count_diff
+   return entry
+
+CAPTURED_FIELDS = ('text', 'latitude', 'longitude', 'lat', 'lon', 'sort', 'order', 'page_size', 'cursor')
+
+def _hash_image_file(image_file):
+   digest = hashlib.sha256()
+   size = 0
+   for chunk in iter(lambda: image_file.read(64 * 1024), b''):
+       digest.update(chunk)
+       size += len(chunk)
+   image_file.seek(0)
+   return digest.hexdigest(), size
+
+def capture_request(data, language, image_file=None):
+   if capture_logger is None or (CAPTURE_SAMPLE < 1.0 and random.random() >= CAPTURE_SAMPLE):
+       return
+   
+   entry = {"ts": round(time.time(), 3), "language": language}
+   for field in CAPTURED_FIELDS:
+       if data.get(field) not in (None, ''):
+           entry[field] = data[field]
+   
+   # Images are recorded by hash and size only
+   image_bytes = None
+   if image_file is not None or 'file' in request.files:
+       entry["image_sha256"], entry["image_bytes"] = _hash_image_file(image_file or request.files['file'].stream)
+   elif data.get('image'):
+       try:
+           image_bytes = base64.b64decode(data['image'])
+       except (ValueError, TypeError):
+           image_bytes = str(data['image']).encode('utf-8')
+   if image_bytes is not None:
+       entry["image_sha256"] = hashlib.sha256(image_bytes).hexdigest()
+       entry["image_bytes"] = len(image_bytes)
+   
+   capture_logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+def location_from_request_data(data):
+   """
+   GPS coordinates from the mobile app resolve the district directly, skipping
+   fuzzy matching on the text. Raises ValueError for unusable coordinates.
+   """
+   latitude = data.get('latitude', data.get('lat'))
+   longitude = data.get('longitude', data.get('lon'))
+   if latitude in (None, '') or longitude in (None, ''):
+       return None
+   try:
+       latitude, longitude = float(latitude), float(longitude)
+   except (TypeError, ValueError):
+       raise ValueError("latitude and longitude must be numbers")
+   if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+       raise ValueError("latitude and longitude are out of range")
+   return resolve_location_from_coordinates(latitude, longitude)
+
+def route_text_query(text, language, location_info=None, paging=None):
+   """Detect the intent of a text query and dispatch it to its handler."""
+   text_lower = text.lower()
+   
+   # Always check for weather queries first and use OpenMeteo API directly
+   with span("intent"):
+       if is_weather_query(text_lower):
+           intent = "weather"
+       elif is_commodity_query(text_lower):
+           intent = "commodity"
+       else:
+           intent = "chat"
+   set_intent(intent)
+   
+   if intent == "weather":
+       return handle_weather_query(text, text_lower, language, location_info=location_info)
+   elif intent == "commodity":
+       return handle_commodity_query(text, text_lower, language, location_info=location_info, paging=paging)
+   else:
+       return handle_general_chat(text, language)
+
 @app.route('/smart_assistant', methods=['POST'])
 def smart_assistant():
    try:
        data = {}
        language = 'en'
        
+       # Raw image/jpeg or image/png body: no multipart framing and no base64,
+       # so the bytes go straight from the socket into the capped spool
+       if request.mimetype in RAW_IMAGE_MIMETYPES:
+           language = normalize_language_code(request.headers.get('X-Language') or request.args.get('language', 'en'))
+           set_intent("disease")
+           try:
+               image_file = spool_upload(request.stream)
+           except ImageTooLargeError as e:
+               return image_too_large_response(e, language)
+           capture_request({}, language, image_file=image_file)
+           return handle_disease_detection(language, image_file=image_file)
+       
        if request.content_type and 'multipart/form-data' in request.content_type:
            data = dict(request.form)
            language = data.get('language', 'en')
@@ -1404,9 +4265,21 @@ def smart_assistant():
        
        language = normalize_language_code(language)
        
+       capture_request(data, language)
+       
        if 'file' in request.files or (data and 'image' in data):
+           set_intent("disease")
            return handle_disease_detection(language)
        
+       try:
+           paging = parse_paging_args(data)
+       except ValueError as e:
+           return create_response("Invalid pagination parameters", error=str(e), status=400)
+       
+       if paging['cursor']:
+           set_intent("commodity")
+           return handle_commodity_page(paging['cursor'], language, paging['page_size'])
+       
        text = data.get('text', '').strip()
        
        if not text:
@@ -1416,28 +4289,495 @@ def smart_assistant():
                status=400
            )
        
-       text_lower = text.lower()
+       try:
+           location_info = location_from_request_data(data)
+       except ValueError as e:
+           return create_response("Invalid coordinates", error=str(e), status=400)
        
-       # Always check for weather queries first and use OpenMeteo API directly
-       if is_weather_query(text_lower):
-           return handle_weather_query(text, text_lower, language)
-       elif is_commodity_query(text_lower):
-           return handle_commodity_query(text, text_lower, language)
-       else:
-           return handle_general_chat(text, language)
+       return route_text_query(text, language, location_info=location_info, paging=paging)
            
+   except RequestEntityTooLarge:
+       raise
    except Exception as e:
-       print(f"Smart assistant error: {str(e)}")
+       logger.exception("Smart assistant error: %s", e)
        return create_response(
            "Failed to process request", 
            error=f"An error occurred: {str(e)}", 
            status=500
        )
 
+@app.route('/disease_jobs', methods=['POST'])
+def submit_disease_job():
+   """
+   Same photo inputs as /smart_assistant (multipart file, base64 JSON or a raw
+   image/jpeg or image/png body). Answers 202 with the job; poll its
+   status_url or pass callback_url to have the finished job POSTed back.
+   """
+   # Only the header or query string is read before a slot is taken, so a
+   # full pool turns uploads away without receiving them
+   language = normalize_language_code(request.headers.get('X-Language') or request.args.get('language') or 'en')
+   set_intent("disease")
+   
+   if not get_rekognition_client():
+       return create_response(
+           DISEASE_MESSAGES["invalid_image"][language],
+           error="AWS Rekognition service not configured",
+           status=503
+       )
+   
+   if not DISEASE_JOB_SLOTS.acquire(blocking=False):
+       DISEASE_JOB_OUTCOMES.inc(result="rejected")
+       response, status = create_response(
+           DISEASE_MESSAGES["job_busy"][language],
+           error=DISEASE_MESSAGES["job_busy"][language],
+           status=503
+       )
+       response.headers['Retry-After'] = str(DISEASE_JOB_RETRY_AFTER)
+       return response, status
+   
+   submitted = False
+   try:
+       data = dict(request.form) if request.form else (get_request_data() if request.is_json else {})
+       language = normalize_language_code(data.get('language') or language)
+       callback_url = data.get('callback_url') or request.args.get('callback_url')
+       if callback_url and not callback_allowed(callback_url):
+           return create_response("Invalid callback URL", error="callback_url host is not allowed", status=400)
+       
+       try:
+           if request.mimetype in RAW_IMAGE_MIMETYPES:
+               image_file = spool_upload(request.stream)
+           else:
+               image_file, error_response = disease_image_from_request(language)
+               if error_response:
+                   return error_response
+               if 'file' in request.files:
+                   image_file = detach_upload(image_file)
+       except ImageTooLargeError as e:
+           return image_too_large_response(e, language)
+       
+       job_id = uuid.uuid4().hex
+       job = {
+           "job_id": job_id,
+           "status": "queued",
+           "status_url": f"/disease_jobs/{job_id}",
+           "language": language,
+           "created_at": round(time.time(), 3),
+       }
+       if callback_url:
+           job["callback_url"] = callback_url
+       DISEASE_JOBS.set(job_id, job)
+       DISEASE_JOBS_PENDING.inc()
+       DISEASE_EXECUTOR.submit(run_disease_job, job, image_file)
+       submitted = True
+       
+       response, status = create_response(DISEASE_MESSAGES["job_queued"][language], data=job, status=202)
+       response.headers['Location'] = job["status_url"]
+       return response, status
+   finally:
+       if not submitted:
+           DISEASE_JOB_SLOTS.release()
+
+@app.route('/disease_jobs/<job_id>', methods=['GET'])
+def disease_job_status(job_id):
+   job = DISEASE_JOBS.get(job_id) if DISEASE_JOB_PATTERN.match(job_id) else None
+   if job is None:
+       language = normalize_language_code(request.headers.get('X-Language') or request.args.get('language') or 'en')
+       return create_response(
+           DISEASE_MESSAGES["job_not_found"][language],
+           error=DISEASE_MESSAGES["job_not_found"][language],
+           status=404
+       )
+   
+   if job["status"] in ("queued", "running"):
+       response, status = create_response(DISEASE_MESSAGES["job_pending"][job["language"]], data=job, status=200)
+       response.headers['Retry-After'] = '2'
+       return response, status
+   return create_response(job["result"]["message"], data=job, status=200)
+
+@app.route('/speech_to_text', methods=['POST'])
+def speech_to_text():
+   data = dict(request.form) if request.form else (get_request_data() if request.is_json else {})
+   language = normalize_language_code(data.get('language') or request.headers.get('X-Language') or 'en')
+   set_intent("voice")
+   
+   try:
+       audio_bytes = read_uploaded_audio(data)
+   except ValueError as e:
+       return create_response("Invalid audio", error=str(e), status=413 if "too large" in str(e) else 400)
+   if not audio_bytes:
+       return create_response("No audio provided", error="Please upload recorded audio", status=400)
+   
+   try:
+       transcript = transcribe_audio(audio_bytes, language)
+   except AudioDecodeError as e:
+       return create_response("Unsupported audio", error=str(e), status=415)
+   except STTError as e:
+       logger.error("Speech recognition failed: %s", e, extra={"language": language})
+       return create_response("Speech recognition unavailable", error="Unable to transcribe audio", status=503)
+   
+   if not transcript:
+       return create_response(
+           "No speech detected",
+           error=VOICE_MESSAGES["no_speech"][language],
+           status=422
+       )
+   if str(data.get('route', 'true')).lower() in ('false', '0', 'no'):
+       return create_response("Speech transcribed successfully", data={"transcript": transcript}, status=200)
+   
+   # One round-trip: the transcript is answered like a typed /smart_assistant query
+   try:
+       location_info = location_from_request_data(data)
+   except ValueError:
+       location_info = None
+   response, status = route_text_query(transcript, language, location_info=location_info)
+   payload = response.get_json()
+   payload.setdefault("data", {})["transcript"] = transcript
+   return jsonify(payload), status
+
+@app.route('/voice_session', methods=['POST'])
+def voice_session():
+   """
+   Chunked audio in, NDJSON events out: partial, utterance, transcript,
+   response, audio (one per sentence), done, or error. Options go in the query
+   string since the body is the audio itself.
+   """
+   language = normalize_language_code(request.args.get('language') or request.headers.get('X-Language') or 'en')
+   speak = request.args.get('speak', 'true').lower() not in ('false', '0', 'no')
+   set_intent("voice")
+   try:
+       location_info = location_from_request_data(request.args)
+   except ValueError as e:
+       return create_response("Invalid coordinates", error=str(e), status=400)
+   
+   variant = negotiate_audio_variant(request.args, request.headers)
+   events = run_voice_session(request.stream, request.mimetype, language, location_info=location_info, speak=speak,
+                              variant=variant)
+   return Response(
+       stream_with_context(events),
+       mimetype='application/x-ndjson',
+       headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+   )
+
+@app.route('/market_comparison', methods=['GET'])
+def market_comparison():
+   commodity = request.args.get('commodity', '').strip()
+   language = normalize_language_code(request.args.get('language', 'en'))
+   
+   if not commodity:
+       return create_response(
+           "No commodity provided",
+           error="Please provide a commodity to compare",
+           status=400
+       )
+   
+   try:
+       top_n = max(1, min(int(request.args.get('top', MARKET_COMPARISON_TOP_N)), len(GUJARAT_DISTRICTS)))
+   except ValueError:
+       return create_response("Invalid top value", error="top must be a number", status=400)
+   
+   commodity = extract_commodity_from_text(commodity) or commodity
+   return get_market_comparison_internal(commodity, request.args.get('date'), language, top_n=top_n)
+
+@app.route('/text_to_speech', methods=['POST'])
+def text_to_speech():
+   data = get_request_data()
+   text = str(data.get('text', '') or '')
+   language = normalize_language_code(data.get('language', 'en'))
+   voice = data.get('voice')
+   variant = negotiate_audio_variant(data, request.headers)
+   set_intent("tts")
+   
+   if not normalize_speech_text(text):
+       return create_response("No text provided", error="Please provide text to convert to speech", status=400)
+   if len(text) > TTS_MAX_CHARS:
+       return create_response(
+           "Text too long",
+           error=f"Text must be at most {TTS_MAX_CHARS} characters",
+           status=413
+       )
+   
+   try:
+       key, cached = synthesize_speech(text, language, voice)
+       try:
+           audio_bytes, variant, mimetype = transcode_audio(key, variant)
+       except AudioDecodeError as e:
+           logger.warning("Audio transcode failed, serving the original: %s", e, extra={"variant": variant})
+           audio_bytes, variant, mimetype = transcode_audio(key, None)
+       if audio_bytes is None:
+           raise RuntimeError("synthesized audio was evicted before it could be read")
+   except Exception as e:
+       logger.error("Text-to-speech failed: %s", e, extra={"language": language})
+       return create_response("Speech service unavailable", error="Unable to generate speech", status=503)
+   
+   response_data = {
+       "audio_url": audio_url(key, variant),
+       "format": VARIANT_PATTERN.match(variant).group(1) if variant else TTS_BACKEND.extension.lstrip('.'),
+       "variant": variant or "original",
+       "mimetype": mimetype,
+       "language": language,
+       "cached": cached,
+       "bytes": len(audio_bytes)
+   }
+   # Clients that can fetch the URL (and use Range requests) can skip the
+   # base64 copy with "inline": false.
+   if str(data.get('inline', 'true')).lower() not in ('false', '0', 'no'):
+       response_data["audio"] = base64.b64encode(audio_bytes).decode('ascii')
+   return create_response("Speech generated successfully", data=response_data, status=200)
+
+@app.route('/audio/<key>', methods=['GET'])
+def cached_audio(key):
+   if not AUDIO_KEY_PATTERN.match(key):
+       return create_response("Invalid audio key", error="Unknown audio", status=404)
+   variant = request.args.get('variant')
+   if variant and variant not in AUDIO_VARIANTS:
+       return create_response("Invalid audio variant", error="Unknown audio variant", status=404)
+   
+   if variant:
+       try:
+           audio_bytes, variant, mimetype = transcode_audio(key, variant)
+       except AudioDecodeError as e:
+           logger.warning("Audio transcode failed: %s", e, extra={"variant": variant})
+           return create_response("Transcode failed", error="Unable to encode audio", status=503)
+       path = io.BytesIO(audio_bytes) if audio_bytes is not None else None
+   else:
+       mimetype = TTS_BACKEND.mimetype
+       catalogued = AUDIO_CATALOGUE.get(key)
+       path = io.BytesIO(catalogued) if catalogued is not None else AUDIO_CACHE.get(key)
+   if path is None:
+       return create_response("Audio not found", error="Audio has expired or was never generated", status=404)
+   # Content-addressed, so the bytes behind a key and variant never change
+   etag = f"{key}-{variant}" if variant else key
+   response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=86400)
+   response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+   return response
+
+@app.before_request
+def apply_body_limit():
+   limit = ENDPOINT_BODY_LIMITS.get(request.endpoint)
+   if limit:
+       request.max_content_length = limit
+
+@app.errorhandler(413)
+def request_too_large(e):
+   return create_response(
+       "Request too large",
+       error=f"Request bodies are limited to {request.max_content_length} bytes",
+       status=413
+   )
+
+@app.before_request
+def ensure_background_tasks():
+   if not _background_started:
+       start_background_tasks()
+
+@app.before_request
+def start_request_metrics():
+   g.request_started = time.perf_counter()
+   g.request_wall_start = time.time()
+   g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+   g.spans = []
+   g.want_timings = request.args.get('timings') in ('1', 'true') or request.headers.get('X-Debug-Timings') == '1'
+   g.intent = "unrouted"
+   IN_FLIGHT.inc(endpoint=request.endpoint or "unknown")
+
+def record_request_outcome(state, method, path, endpoint, status):
+   """Intent metrics, access log line and trace for a finished request; state is its g."""
+   totals = summarize_spans(state)
+   if endpoint == 'smart_assistant':
+       INTENT_LATENCY.observe(totals["total"][0], intent=state.intent)
+       INTENT_REQUESTS.inc(intent=state.intent, status=status)
+   
+   if endpoint not in ('metrics', 'health'):
+       logger.info(
+           "%s %s %d", method, path, status,
+           extra={
+               "request_id": state.request_id,
+               "status": status,
+               "intent": state.intent,
+               "duration_ms": round(totals["total"][0] * 1000, 2),
+               "sample": LOG_ACCESS_SAMPLE
+           }
+       )
+   
+   if TRACE_FILE and endpoint != 'metrics':
+       try:
+           export_trace(state.request_id, path, state.spans, state.request_wall_start, totals["total"][0])
+       except OSError as e:
+           logger.warning("Trace export failed: %s", e)
+
+@app.after_request
+def record_request_metrics(response):
+   response.headers['Server-Timing'] = server_timing_header(summarize_spans())
+   response.headers['Timing-Allow-Origin'] = '*'
+   response.headers['X-Request-ID'] = g.request_id
+   
+   outcome = (g._get_current_object(), request.method, request.path, request.endpoint, response.status_code)
+   if response.is_streamed:
+       # Headers go out before a streamed body (/voice_session) is produced, so its
+       # intent, spans and duration are only final once the stream is closed
+       response.call_on_close(lambda: record_request_outcome(*outcome))
+   else:
+       record_request_outcome(*outcome)
+   return response
+
+@app.teardown_request
+def finish_request_metrics(exc=None):
+   if 'request_started' in g:
+       IN_FLIGHT.dec(endpoint=request.endpoint or "unknown")
+
+@app.before_request
+def start_request_profile():
+   if request.headers.get('X-Profile') != '1' and request.args.get('profile') != '1':
+       return
+   if not is_admin_request():
+       return
+   if not _reserve_profile_slot():
+       g.profile_status = "limit reached"
+       return
+   g.profiler = cProfile.Profile()
+   g.profiler.enable()
+
+@app.after_request
+def finish_request_profile(response):
+   profiler = g.pop('profiler', None)
+   if profiler is not None:
+       profiler.disable()
+       try:
+           response.headers['X-Profile-Id'] = save_profile(profiler, time.perf_counter() - g.request_started)
+       except OSError as e:
+           _release_profile_slot()
+           logger.warning("Saving profile failed: %s", e)
+   elif g.get('profile_status'):
+       response.headers['X-Profile-Status'] = g.profile_status
+   return response
+
+@app.route('/admin/profiles', methods=['GET'])
+@admin_required
+def admin_list_profiles():
+   return create_response(
+       "Profiles listed",
+       data={"profiles": list_profiles(), "max_captures": PROFILE_MAX_CAPTURES},
+       status=200
+   )
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET', 'DELETE'])
+@admin_required
+def admin_profile(profile_id):
+   if not PROFILE_ID_PATTERN.match(profile_id) or not os.path.exists(_profile_path(profile_id, '.prof')):
+       return create_response("Profile not found", error=f"No profile {profile_id}", status=404)
+   
+   if request.method == 'DELETE':
+       for suffix in ('.prof', '.json'):
+           try:
+               os.remove(_profile_path(profile_id, suffix))
+           except FileNotFoundError:
+               pass
+       _release_profile_slot()
+       return create_response("Profile deleted", data={"id": profile_id}, status=200)
+   
+   if request.args.get('format') == 'raw':
+       with open(_profile_path(profile_id, '.prof'), 'rb') as prof_file:
+           return Response(
+               prof_file.read(),
+               mimetype='application/octet-stream',
+               headers={'Content-Disposition': f'attachment; filename="{profile_id}.prof"'}
+           )
+   
+   sort_key = request.args.get('sort', 'cumulative')
+   if sort_key not in ('cumulative', 'tottime', 'calls', 'ncalls', 'time'):
+       return create_response("Invalid sort key", error="sort must be cumulative, tottime or calls", status=400)
+   try:
+       limit = max(1, min(int(request.args.get('limit', 40)), 500))
+   except ValueError:
+       return create_response("Invalid limit", error="limit must be a number", status=400)
+   
+   output = io.StringIO()
+   stats = pstats.Stats(_profile_path(profile_id, '.prof'), stream=output)
+   stats.strip_dirs().sort_stats(sort_key).print_stats(limit)
+   return Response(output.getvalue(), mimetype='text/plain; charset=utf-8')
+
+@app.route('/admin/memory', methods=['GET'])
+@admin_required
+def admin_memory():
+   traced_current, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+   return create_response(
+       "Memory usage collected",
+       data={
+           "rss_bytes": current_rss_bytes(),
+           "caches": collect_cache_sizes(),
+           "tracemalloc": {
+               "tracing": tracemalloc.is_tracing(),
+               "traced_current_bytes": traced_current,
+               "traced_peak_bytes": traced_peak,
+               "snapshots": [taken_at for taken_at, _ in MEMORY_SNAPSHOTS]
+           }
+       },
+       status=200
+   )
+
+@app.route('/admin/memory/snapshot', methods=['POST'])
+@admin_required
+def admin_memory_snapshot():
+   count = take_memory_snapshot()
+   return create_response(
+       "Memory snapshot taken",
+       data={"snapshots": count, "hint": "take a second snapshot, then GET /admin/memory/diff"},
+       status=200
+   )
+
+@app.route('/admin/memory/diff', methods=['GET'])
+@admin_required
+def admin_memory_diff():
+   key_type = request.args.get('group_by', 'lineno')
+   if key_type not in ('lineno', 'filename', 'traceback'):
+       return create_response("Invalid group_by", error="group_by must be lineno, filename or traceback", status=400)
+   try:
+       limit = max(1, min(int(request.args.get('limit', 25)), 200))
+   except ValueError:
+       return create_response("Invalid limit", error="limit must be a number", status=400)
+   
+   with MEMORY_SNAPSHOT_LOCK:
+       snapshots = list(MEMORY_SNAPSHOTS)
+   if not snapshots:
+       return create_response("No snapshots", error="POST /admin/memory/snapshot first", status=409)
+   
+   if len(snapshots) == 1:
+       stats = snapshots[0][1].statistics(key_type)[:limit]
+       compared = None
+   else:
+       stats = snapshots[1][1].compare_to(snapshots[0][1], key_type)[:limit]
+       compared = [snapshots[0][0], snapshots[1][0]]
+   
+   return create_response(
+       "Memory snapshot statistics",
+       data={"compared": compared, "top": [_format_stat(stat, key_type) for stat in stats]},
+       status=200
+   )
+
+@app.route('/admin/memory/tracing', methods=['DELETE'])
+@admin_required
+def admin_memory_stop_tracing():
+   with MEMORY_SNAPSHOT_LOCK:
+       if tracemalloc.is_tracing():
+           tracemalloc.stop()
+       MEMORY_SNAPSHOTS.clear()
+   return create_response("Memory tracing stopped", data={"tracing": False}, status=200)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+   return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/health', methods=['GET'])
 def health_check():
    return create_response("Service is healthy", data={"status": "UP"}, status=200)
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+   report = readiness_report()
+   if report["ready"]:
+       return create_response("Service is ready", data=report, status=200)
+   return create_response("Service is warming up", data=report, status=503)
+
 @app.route('/', methods=['GET'])
 def root():
    return create_response(
@@ -1454,7 +4794,7 @@ def root():
                "Improved tomato detection with 'tamatar' support",
                "Better fallback logic - shows empty result if specific commodity not found",
                "Hybrid commodity detection - flexible for Gujarati, precise for English",
-               "Default commodity date set to 01/07/2025 for consistent data retrieval",
+               "Dateless commodity queries use the newest date with recorded arrivals",
                "Fixed weather queries to always use OpenMeteo API in all languages",
                "Weather information for Gujarat districts",
                "Vegetable disease detection using AI",
@@ -1465,12 +4805,22 @@ def root():
    )
    
 if __name__ == '__main__':
+    if '--build-audio-catalogue' in sys.argv:
+        count = build_audio_catalogue()
+        print(f"Audio catalogue with {count} messages written to {AUDIO_CATALOGUE_DIR}")
+        sys.exit(0)
+    
     port = find_free_port()
+    # With debug=True the reloader runs this script twice; the parent only
+    # watches files, so only the child that serves requests starts the work
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_tasks()
     
     print(f"\n🚀 Starting Fixed Gujarat Smart Assistant API...")
     print(f"🌐 Running on: http://localhost:{port}")
     print(f"📍 Main endpoint: http://localhost:{port}/smart_assistant")
     print(f"🏥 Health check: http://localhost:{port}/health")
+    print(f"🚦 Readiness: http://localhost:{port}/ready")
     
     if port != 5000:
         print(f"⚠️  Note: Port 5000 was occupied, using port {port} instead")
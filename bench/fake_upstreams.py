@@ -0,0 +1,275 @@
+"""
+Local stand-ins for every upstream the assistant talks to, so load can be
+generated on a laptop with no network.
+
+One threaded HTTP server on 127.0.0.1 answers for Open-Meteo, data.gov.in,
+the Anthropic messages API and Rekognition DetectCustomLabels. Google
+Translate is scraped from HTML by deep_translator, so it is replaced
+in-process with FakeTranslator instead. Every upstream has its own
+configurable latency, jitter and error rate.
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UPSTREAMS = ("open_meteo", "data_gov_in", "google_translate", "anthropic", "rekognition")
+
+# Rough production medians, used when nothing is configured.
+DEFAULT_LATENCY_MS = {
+    "open_meteo": 120,
+    "data_gov_in": 600,
+    "google_translate": 250,
+    "anthropic": 1500,
+    "rekognition": 900,
+}
+
+FAKE_COMMODITIES = [
+    ("Tomato", "Local"), ("Potato", "Desi"), ("Onion", "Red"), ("Brinjal", "Round"),
+    ("Cotton", "Shankar-6"), ("Wheat", "Lokwan"), ("Groundnut", "Bold"), ("Cabbage", "Other"),
+]
+
+FAKE_DISEASE_LABELS = ["Tomato Early Blight", "Tomato Anthracnose", "Tomato Powdery Mildew", "Irrelevant"]
+
+
+class UpstreamProfile:
+    def __init__(self, latency_ms, jitter=0.3, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def simulate(self, rng, rng_lock=None):
+        """Sleep for the configured latency; return False when this call should fail.
+
+        Only the random draws happen under rng_lock, so concurrent calls sleep
+        in parallel instead of queueing behind each other.
+        """
+        with rng_lock or nullcontext():
+            delay = self.latency_ms * (1 + rng.uniform(-self.jitter, self.jitter))
+            failed = rng.random() < self.error_rate
+        time.sleep(max(delay, 0) / 1000.0)
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+        return not failed
+
+
+def build_profiles(latency=None, error_rate=None, jitter=0.3):
+    latency = latency or {}
+    error_rate = error_rate or {}
+    return {
+        name: UpstreamProfile(
+            latency.get(name, DEFAULT_LATENCY_MS[name]), jitter=jitter, error_rate=error_rate.get(name, 0.0)
+        )
+        for name in UPSTREAMS
+    }
+
+
+def _stable_int(*parts):
+    return int(hashlib.md5("|".join(parts).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def fake_arrivals(date_str, district_filter, districts):
+    """Deterministic arrivals: the same (date, district) always yields the same records."""
+    records = []
+    for district in ([district_filter] if district_filter else districts):
+        seed = _stable_int(date_str, district)
+        for offset, (commodity, variety) in enumerate(FAKE_COMMODITIES):
+            # Not every district trades every commodity every day
+            if (seed >> offset) & 3 == 0:
+                continue
+            for market_index in range(1 + (seed >> (offset + 8)) % 3):
+                base = 800 + _stable_int(commodity, district, str(market_index)) % 2400
+                records.append({
+                    "State": "Gujarat",
+                    "District": district,
+                    "Market": f"{district} APMC {market_index + 1}" if market_index else f"{district} APMC",
+                    "Commodity": commodity,
+                    "Variety": variety,
+                    "Grade": "FAQ",
+                    "Arrival_Date": date_str,
+                    "Min_Price": str(base - 200),
+                    "Max_Price": str(base + 300),
+                    "Modal_Price": str(base),
+                })
+    return records
+
+
+def fake_weather():
+    return {
+        "current": {
+            "temperature_2m": 31.4, "relative_humidity_2m": 62, "apparent_temperature": 35.0,
+            "precipitation": 0.0, "weather_code": 2, "wind_speed_10m": 12.3,
+        },
+        "daily": {
+            "weather_code": [2] * 7,
+            "temperature_2m_max": [34.1, 33.8, 33.0, 32.6, 33.3, 34.0, 34.4],
+            "temperature_2m_min": [25.2, 25.0, 24.7, 24.9, 25.3, 25.6, 25.8],
+            "precipitation_sum": [0.0] * 7,
+            "precipitation_probability_max": [10] * 7,
+        },
+    }
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self, upstream):
+        if not self.server.profiles[upstream].simulate(self.server.rng, self.server.rng_lock):
+            self._send_json({"error": f"fake {upstream} failure"}, status=503)
+            return False
+        return True
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+        if parsed.path == "/open-meteo":
+            if self._simulate("open_meteo"):
+                self._send_json(fake_weather())
+        elif parsed.path == "/data-gov":
+            if self._simulate("data_gov_in"):
+                records = fake_arrivals(
+                    query.get("filters[Arrival_Date]", ""), query.get("filters[District]"), self.server.districts
+                )
+                offset = int(query.get("offset", 0))
+                limit = int(query.get("limit", 5000))
+                self._send_json({"records": records[offset:offset + limit], "total": len(records)})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        if self.headers.get("X-Amz-Target", "").endswith("DetectCustomLabels"):
+            if self._simulate("rekognition"):
+                label = FAKE_DISEASE_LABELS[_stable_int(str(len(body))) % len(FAKE_DISEASE_LABELS)]
+                self._send_json({"CustomLabels": [{"Name": label, "Confidence": 91.5}]})
+        elif urlparse(self.path).path.endswith("/v1/messages"):
+            if self._simulate("anthropic"):
+                self._send_json({
+                    "id": "msg_fake", "type": "message", "role": "assistant",
+                    "model": "claude-3-7-sonnet-20250219",
+                    "content": [{"type": "text", "text": "Keep the field well drained and check mandi rates before harvest."}],
+                    "stop_reason": "end_turn", "stop_sequence": None,
+                    "usage": {"input_tokens": 120, "output_tokens": 24},
+                })
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+
+class FakeUpstreams:
+    def __init__(self, profiles, districts, seed=7):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeUpstreamHandler)
+        self.server.daemon_threads = True
+        self.server.profiles = profiles
+        self.server.districts = districts
+        self.server.rng = random.Random(seed)
+        self.server.rng_lock = threading.Lock()
+        self.profiles = profiles
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-upstreams", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def environment(self):
+        """Environment variables that point api.py at these fakes; set before importing it."""
+        return {
+            "OPEN_METEO_URL": f"{self.url}/open-meteo",
+            "DATA_GOV_URL": f"{self.url}/data-gov",
+            "CLAUDE_API_KEY": "fake-key",
+            "CLAUDE_BASE_URL": f"{self.url}/anthropic",
+            "AWS_ACCESS_KEY_ID": "fake",
+            "AWS_SECRET_ACCESS_KEY": "fake",
+            "MODEL_ARN": "arn:aws:rekognition:ap-south-1:000000000000:project/fake/version/fake/1",
+            "REKOGNITION_ENDPOINT_URL": self.url,
+            "ARRIVALS_SYNC_INTERVAL": "0",
+        }
+
+    def stats(self):
+        return {
+            name: {"calls": profile.calls, "errors": profile.errors, "latency_ms": profile.latency_ms}
+            for name, profile in self.profiles.items()
+        }
+
+
+def make_fake_translator(profile, seed=11):
+    """A stand-in for deep_translator.GoogleTranslator with the same constructor and translate()."""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class FakeTranslator:
+        def __init__(self, source="auto", target="en", **kwargs):
+            self.source = source
+            self.target = target
+
+        def translate(self, text, **kwargs):
+            if not profile.simulate(rng, rng_lock):
+                raise RuntimeError("fake google_translate failure")
+            return f"[{self.target}] {text}"
+
+    return FakeTranslator
+
+
+def load_api(fakes, log_level="WARNING"):
+    """Import api.py wired to the fakes. Must run before anything else imports api."""
+    if "api" in sys.modules:
+        raise RuntimeError("api was already imported; start the fakes first")
+    os.environ.update(fakes.environment())
+    os.environ.setdefault("LOG_LEVEL", log_level)
+    # The first request would otherwise start warm-up against the fakes mid-run
+    os.environ.setdefault("WARMUP_ENABLED", "0")
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import api
+
+    api.GoogleTranslator = make_fake_translator(fakes.profiles["google_translate"])
+    # Load tests measure steady state, not the first-use imports (see startup.py)
+    api.prewarm_dependencies()
+    return api
+
+
+def serve_app(app):
+    """Serve the Flask app on a free localhost port in a background thread."""
+    import logging
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="app-server", daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
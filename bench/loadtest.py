@@ -0,0 +1,274 @@
+"""
+Offline load test for /smart_assistant.
+
+Starts the fake upstreams, imports api.py against them, serves it on a local
+port and drives it with a weighted multilingual query mix. Reports throughput
+and p50/p95/p99 latency per intent. No network access is needed.
+
+    python bench/loadtest.py --concurrency 16 --duration 30
+    python bench/loadtest.py --latency anthropic=300 --error-rate data_gov_in=0.05 --json
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from fake_upstreams import UPSTREAMS, FakeUpstreams, build_profiles, load_api, serve_app
+
+# (intent, weight, payload). Weights roughly follow the production mix:
+# mostly prices and weather, some chat, a few disease photos.
+QUERY_MIX = [
+    ("weather", 6, {"text": "What is the weather in Rajkot today?", "language": "en"}),
+    ("weather", 4, {"text": "weather forecast for Surat", "language": "en"}),
+    ("weather", 4, {"text": "અમદાવાદમાં હવામાન કેવું છે?", "language": "gu"}),
+    ("weather", 3, {"text": "वडोदरा में मौसम कैसा है", "language": "hi"}),
+    ("weather", 2, {"text": "wether in rajcot", "language": "en"}),
+    ("weather", 3, {"text": "weather", "language": "gu", "latitude": 21.17, "longitude": 72.83}),
+    ("commodity", 6, {"text": "tomato price in Rajkot", "language": "en"}),
+    ("commodity", 4, {"text": "onion mandi rate in Surat", "language": "en"}),
+    ("commodity", 4, {"text": "અમદાવાદમાં ટામેટા ભાવ", "language": "gu"}),
+    ("commodity", 3, {"text": "वडोदरा में आलू की कीमत", "language": "hi"}),
+    ("commodity", 2, {"text": "potato price in Anand on 01/07/2025", "language": "en"}),
+    ("commodity", 2, {"text": "where to sell tomato top 5", "language": "en", "_intent": "market_comparison"}),
+    ("commodity", 2, {"text": "tomato price", "language": "en", "sort": "modal_price", "page_size": 10}),
+    ("chat", 3, {"text": "How do I protect my cotton crop from pests during monsoon?", "language": "en"}),
+    ("chat", 2, {"text": "ખેતી માટે શાકભાજી રોગ વિશે સલાહ", "language": "gu"}),
+    ("chat", 1, {"text": "tell me a joke", "language": "en"}),
+    ("disease", 2, {"image": None, "language": "en"}),
+    ("disease", 1, {"image": None, "language": "hi"}),
+]
+
+
+# The upstream each intent has to reach. Chat falls back to a canned 200 reply
+# when Anthropic fails, so its errors only show up as missing upstream calls.
+INTENT_UPSTREAMS = {
+    "weather": "open_meteo",
+    "commodity": "data_gov_in",
+    "market_comparison": "data_gov_in",
+    "chat": "anthropic",
+    "disease": "rekognition",
+    "disease_detection": "rekognition",
+}
+
+
+def sample_image_base64(size=(640, 480), seed=3):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (40, 120, 40))
+    pixels = image.load()
+    for _ in range(size[0] * size[1] // 20):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        pixels[x, y] = (rng.randrange(30, 90), rng.randrange(90, 200), rng.randrange(20, 80))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def build_mix():
+    image = sample_image_base64()
+    mix = []
+    for intent, weight, payload in QUERY_MIX:
+        payload = dict(payload)
+        intent = payload.pop("_intent", intent)
+        if "image" in payload:
+            payload["image"] = image
+        mix.append((intent, weight, payload))
+    return mix
+
+
+def reply_ok(response):
+    """A reply fails if its HTTP status or the status in its JSON envelope is a server error."""
+    if response.status_code >= 500:
+        return False
+    try:
+        envelope = response.json()
+    except ValueError:
+        return False
+    status = envelope.get("status") if isinstance(envelope, dict) else None
+    return not isinstance(status, int) or status < 500
+
+
+def upstream_health(report, upstream_stats, api):
+    """
+    Per-upstream errors seen by the API (including calls its breaker refused)
+    and breaker state, plus warnings for upstreams that look broken: an intent
+    was exercised but its upstream took no calls, or the API recorded failures.
+    """
+    health = {
+        name: {"api_errors": api.UPSTREAM_ERRORS.value(upstream=name), "breaker": api.get_breaker(name).state}
+        for name in upstream_stats
+    }
+    warnings = []
+    for intent, upstream in INTENT_UPSTREAMS.items():
+        row = report["intents"].get(intent)
+        if row and upstream in upstream_stats and upstream_stats[upstream]["calls"] == 0:
+            warnings.append(f"{upstream} took 0 calls for {row['count']} {intent} requests; "
+                            f"those replies came from a fallback")
+    for name, row in health.items():
+        if row["api_errors"] or row["breaker"] != "closed":
+            warnings.append(f"{name}: {row['api_errors']} failed or refused calls, breaker {row['breaker']}")
+    return health, warnings
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    by_intent = defaultdict(list)
+    errors = defaultdict(int)
+    for intent, latency, ok in samples:
+        by_intent[intent].append(latency)
+        if not ok:
+            errors[intent] += 1
+
+    report = {
+        "requests": len(samples),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "intents": {},
+    }
+    for intent, latencies in sorted(by_intent.items()):
+        latencies.sort()
+        report["intents"][intent] = {
+            "count": len(latencies),
+            "errors": errors[intent],
+            "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        }
+    return report
+
+
+def print_report(report, upstream_stats):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s)\n")
+    print(f"{'intent':<20}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for intent, row in report["intents"].items():
+        print(f"{intent:<20}{row['count']:>7}{row['errors']:>8}{row['rps']:>9}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print("\nupstream calls:")
+    for name, row in upstream_stats.items():
+        line = f"  {name:<18}{row['calls']:>7} calls {row['errors']:>5} errors  ({row['latency_ms']} ms)"
+        if "breaker" in row:
+            line += f"  api errors {row['api_errors']}, breaker {row['breaker']}"
+        print(line)
+    for warning in report.get("warnings", []):
+        print(f"WARNING: {warning}")
+
+
+def run_load(base_url, mix, concurrency, duration=None, total_requests=None, seed=1):
+    weights = [weight for _, weight, _ in mix]
+    samples = []
+    samples_lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def claim():
+        with samples_lock:
+            if total_requests is not None and issued[0] >= total_requests:
+                return False
+            issued[0] += 1
+        return deadline is None or time.perf_counter() < deadline
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        while claim():
+            intent, _, payload = rng.choices(mix, weights=weights)[0]
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/smart_assistant", json=payload, timeout=60)
+                ok = reply_ok(response)
+            except requests.RequestException:
+                ok = False
+            latency = time.perf_counter() - start
+            with samples_lock:
+                samples.append((intent, latency, ok))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for worker_id in range(concurrency):
+            pool.submit(worker, worker_id)
+    return samples, time.perf_counter() - started
+
+
+def parse_upstream_values(pairs, cast):
+    values = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition("=")
+        if name not in UPSTREAMS:
+            raise SystemExit(f"unknown upstream {name!r}; choose from {', '.join(UPSTREAMS)}")
+        values[name] = cast(value)
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=MS",
+                        help="mean latency for an upstream, e.g. anthropic=300")
+    parser.add_argument("--error-rate", action="append", metavar="UPSTREAM=RATE",
+                        help="failure probability for an upstream, e.g. data_gov_in=0.05")
+    parser.add_argument("--jitter", type=float, default=0.3, help="relative latency jitter (default 0.3)")
+    parser.add_argument("--warmup", type=int, default=20, help="requests to send before measuring")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    profiles = build_profiles(
+        latency=parse_upstream_values(args.latency, float),
+        error_rate=parse_upstream_values(args.error_rate, float),
+        jitter=args.jitter,
+    )
+    fakes = FakeUpstreams(profiles, districts=[]).start()
+    api = load_api(fakes)
+    fakes.server.districts = list(api.GUJARAT_DISTRICTS)
+    server, base_url = serve_app(api.app)
+
+    mix = build_mix()
+    try:
+        if args.warmup:
+            run_load(base_url, mix, args.concurrency, total_requests=args.warmup, seed=args.seed + 1)
+        samples, elapsed = run_load(
+            base_url, mix, args.concurrency,
+            duration=None if args.requests else args.duration,
+            total_requests=args.requests,
+            seed=args.seed,
+        )
+    finally:
+        server.shutdown()
+        fakes.stop()
+
+    report = summarize(samples, elapsed)
+    report["upstreams"] = fakes.stats()
+    health, report["warnings"] = upstream_health(report, report["upstreams"], api)
+    for name, row in health.items():
+        report["upstreams"][name].update(row)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, report["upstreams"])
+    return report
+
+
+if __name__ == "__main__":
+    main()
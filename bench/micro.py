@@ -0,0 +1,229 @@
+"""
+Micro-benchmarks for the pure-Python code on the request path.
+
+Each case runs against a fixed corpus and reports operations per second.
+--save writes the results as the baseline. Later runs are compared against
+it, and any case slower than the tolerance is flagged. The exit status is 1
+when a regression is found, so the script can gate a CI job.
+
+    python bench/micro.py --save            # record a baseline on this machine
+    python bench/micro.py                   # compare against it
+    python bench/micro.py -k district -k price --tolerance 0.1
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("ARRIVALS_SYNC_INTERVAL", "0")
+sys.path.insert(0, REPO_ROOT)
+
+import api  # noqa: E402
+
+# District names as users actually type or speak them: exact, misspelled,
+# transliterated, in Gujarati and Hindi script, and embedded in sentences.
+DISTRICT_CORPUS = [
+    "rajkot", "rajcot", "raajkot", "raj coat", "ahmedabad", "amdavad", "ahemdabad", "ahmdabad",
+    "surat", "suraat", "vadodra", "baroda", "bhavnagr", "jamnager", "junagad", "mehsaana",
+    "banaskanta", "sabarkanta", "gir somnath", "devbhumi dwarka", "chota udepur", "panchmahal",
+    "રાજકોટ", "અમદાવાદ", "સુરાત", "વડોદરા", "ભાવનગર", "જુનાગઢ", "કચ્છ", "બનાસકાંઠા",
+    "राजकोट", "अहमदाबाद", "सूरत", "वडोदरा", "जामनगर", "कच्छ",
+    "weather in rajkot today", "what is the temperature in amdavad", "mausam surat ma kevu che",
+    "rain forecast for navsari tomorrow", "tomato price in vadodra mandi", "xyzzy", "hello there",
+]
+
+COMMODITY_CORPUS = [
+    "tomato price in rajkot", "what is the rate of onion today", "potato mandi bhav",
+    "બટાટા ભાવ રાજકોટ", "ટામેટા નો ભાવ", "ડુંગળી કેટલા રૂપિયા", "आलू की कीमत", "टमाटर का भाव",
+    "batata no bhav", "kando ketla rupiya", "ringan price", "baingan rate in surat",
+    "cotton price in amreli", "wheat rate 01/07/2025", "groundnut mandi price junagadh",
+    "weather in surat", "hello", "price of rice in anand",
+]
+
+DATE_CORPUS = [
+    "tomato price on 01/07/2025", "onion rate 5-8-2025", "5th August 2025 potato price",
+    "21 Jul 2025 cotton", "31/02/2025 invalid date", "price today", "bhav 12/12/2024 rajkot",
+    "3rd March 2025", "no date here at all", "15-06-2025 mandi",
+]
+
+QUERY_CORPUS = [
+    "weather in rajkot", "tell me a joke about farmers", "tomato price today", "write a poem about rain",
+    "કપાસ ખેતી માટે સલાહ", "मौसम कैसा है", "what is the history of surat", "best crop for sandy soil",
+    "how to cure tomato disease", "programming in python", "mandi rate for wheat", "hello",
+]
+
+PRICE_CORPUS = [
+    "1200", "1,250", "₹1,500", "1500.50", " 980 ", "N/A", "", None, "nil", "0", "Rs. 2,300/-",
+    "1200-1400", "₹ 1 , 100", "abc", "3500.0", "12,00,000", "$45", "na", "750.75 per qtl",
+]
+
+
+def _record(rng, index):
+    return {
+        "Commodity": rng.choice(["Tomato", "Onion", "Potato", "Brinjal", "Cotton"]),
+        "Variety": rng.choice(["Local", "Hybrid", "Red", "Desi", "Other"]),
+        "Market": f"Market {index}",
+        "District": rng.choice(list(api.GUJARAT_DISTRICTS)),
+        "Min_Price": rng.choice(PRICE_CORPUS),
+        "Max_Price": rng.choice(PRICE_CORPUS),
+        "Modal_Price": rng.choice(PRICE_CORPUS),
+        "Arrival_Date": "01/07/2025",
+    }
+
+
+RECORD_CORPUS = [_record(random.Random(42), index) for index in range(25)]
+
+
+def make_image(width, height, fmt, mode="RGB", seed=5):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new(mode, (width, height), (30, 110, 40) if mode == "RGB" else (30, 110, 40, 255))
+    pixels = image.load()
+    for _ in range(width * height // 50):
+        x, y = rng.randrange(width), rng.randrange(height)
+        colour = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        pixels[x, y] = colour if mode == "RGB" else colour + (rng.randrange(256),)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def corpus_case(func, corpus):
+    def run():
+        for item in corpus:
+            func(item)
+    return run, len(corpus)
+
+
+def build_cases():
+    cases = {
+        "find_closest_district": corpus_case(api.find_closest_district, DISTRICT_CORPUS),
+        "extract_location_from_command": corpus_case(api.extract_location_from_command, DISTRICT_CORPUS),
+        "extract_commodity_from_text": corpus_case(api.extract_commodity_from_text, COMMODITY_CORPUS),
+        "extract_date_from_text": corpus_case(api.extract_date_from_text, DATE_CORPUS),
+        "is_query_allowed": corpus_case(api.is_query_allowed, QUERY_CORPUS),
+        "clean_price": corpus_case(api.clean_price, PRICE_CORPUS),
+    }
+
+    for language in ("en", "gu"):
+        def format_run(language=language):
+            api.format_commodity_response(RECORD_CORPUS[:5], "Rajkot", "01/07/2025", "tomato", language,
+                                          total=len(RECORD_CORPUS), start=0)
+        cases[f"format_commodity_response[{language}]"] = (format_run, 1)
+
+    # Image sizes from a thumbnail up to a full phone photo that needs resizing
+    for width, height, fmt, mode in ((320, 240, "JPEG", "RGB"), (1280, 960, "JPEG", "RGB"),
+                                     (1024, 1024, "PNG", "RGBA"), (4608, 3456, "JPEG", "RGB")):
+        image_bytes = make_image(width, height, fmt, mode)
+
+        def image_run(image_bytes=image_bytes):
+            api.convert_image_to_supported_format(image_bytes)
+        cases[f"convert_image[{width}x{height} {fmt}]"] = (image_run, 1)
+
+    return cases
+
+
+def measure(run, ops_per_call, min_time, repeats):
+    # Calibrate the loop count so each repeat takes about min_time seconds
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 4 or loops >= 1 << 20:
+            break
+        loops *= 2
+    loops = max(1, int(loops * (min_time / max(elapsed, 1e-9))))
+
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        best = max(best, loops * ops_per_call / elapsed)
+    return best
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding="utf-8") as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filters", action="append", help="only run cases whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.3, help="seconds per repeat (default 0.3)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown vs baseline before flagging (default 0.15 = 15%%)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    cases = build_cases()
+    if args.filters:
+        cases = {name: case for name, case in cases.items() if any(f in name for f in args.filters)}
+
+    baseline = load_baseline(args.baseline)
+    baseline_results = (baseline or {}).get("results", {})
+
+    results = {}
+    regressions = []
+    rows = []
+    for name, (run, ops_per_call) in cases.items():
+        ops = measure(run, ops_per_call, args.min_time, args.repeats)
+        results[name] = round(ops, 2)
+        previous = baseline_results.get(name)
+        change = (ops / previous - 1) if previous else None
+        flagged = change is not None and change < -args.tolerance
+        if flagged:
+            regressions.append(name)
+        rows.append((name, ops, previous, change, flagged))
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions}, indent=2))
+    else:
+        print(f"{'case':<42}{'ops/sec':>14}{'baseline':>14}{'change':>10}")
+        for name, ops, previous, change, flagged in rows:
+            previous_text = f"{previous:,.0f}" if previous else "-"
+            change_text = f"{change * 100:+.1f}%" if change is not None else "-"
+            print(f"{name:<42}{ops:>14,.0f}{previous_text:>14}{change_text:>10}{'  REGRESSION' if flagged else ''}")
+
+    if args.save:
+        merged = dict(baseline_results)
+        merged.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "platform": platform.platform(),
+                "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": merged,
+            }, baseline_file, indent=2, ensure_ascii=False)
+        print(f"\nBaseline written to {args.baseline}")
+    elif baseline is None:
+        print("\nNo baseline found; run with --save to record one.")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
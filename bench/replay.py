@@ -0,0 +1,207 @@
+"""
+Replay a /smart_assistant traffic capture.
+
+Captures come from running the API with CAPTURE_FILE=/path/capture.jsonl.
+Each line holds the request's timestamp, text, language and optional
+coordinates or paging fields. Images are recorded only as a sha256 and a
+byte count. During replay, each image hash maps to a deterministic synthetic
+JPEG of similar size, so repeated uploads stay repeated.
+
+Requests are sent open-loop on the original schedule, divided by --speed.
+Without --url, the API is started in-process against the fake upstreams from
+fake_upstreams.py, so no network is needed.
+
+    python bench/replay.py capture.jsonl --speed 5
+    python bench/replay.py capture.jsonl --url http://localhost:5000 --speed 1
+"""
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from fake_upstreams import FakeUpstreams, build_profiles, load_api, serve_app
+from loadtest import percentile, print_report, reply_ok, summarize, upstream_health
+
+PAYLOAD_FIELDS = ("text", "language", "latitude", "longitude", "lat", "lon", "sort", "order", "page_size", "cursor")
+
+
+def load_capture(path, limit=None):
+    entries = []
+    with open(path, encoding="utf-8") as capture_file:
+        for line in capture_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+            if limit and len(entries) >= limit:
+                break
+    entries.sort(key=lambda entry: entry.get("ts", 0))
+    return entries
+
+
+_image_cache = {}
+_image_lock = threading.Lock()
+
+
+def image_for_hash(image_sha256, image_bytes):
+    """Deterministic stand-in image of roughly the captured size for a given hash."""
+    with _image_lock:
+        cached = _image_cache.get(image_sha256)
+    if cached is not None:
+        return cached
+
+    from PIL import Image
+
+    rng = random.Random(image_sha256)
+    # Noisy JPEGs at quality 85 come out near 0.5 bytes per pixel
+    pixels = max(64 * 64, int((image_bytes or 200_000) / 0.5))
+    width = max(64, min(4096, int(math.sqrt(pixels * 4 / 3))))
+    height = max(64, min(4096, int(width * 3 / 4)))
+    image = Image.effect_noise((width, height), 60).convert("RGB")
+    tint = Image.new("RGB", (width, height), (rng.randrange(20, 80), rng.randrange(90, 200), rng.randrange(20, 80)))
+    image = Image.blend(image, tint, 0.6)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    with _image_lock:
+        _image_cache[image_sha256] = encoded
+    return encoded
+
+
+def build_payload(entry):
+    payload = {field: entry[field] for field in PAYLOAD_FIELDS if field in entry}
+    if entry.get("image_sha256"):
+        payload["image"] = image_for_hash(entry["image_sha256"], entry.get("image_bytes"))
+    return payload
+
+
+def replay(base_url, entries, speed, max_workers):
+    samples = []
+    lags = []
+    lock = threading.Lock()
+    origin = entries[0].get("ts", 0) if entries else 0
+    session_local = threading.local()
+
+    def send(entry, payload):
+        session = getattr(session_local, "session", None)
+        if session is None:
+            session = session_local.session = requests.Session()
+        start = time.perf_counter()
+        intent = "error"
+        ok = False
+        try:
+            response = session.post(f"{base_url}/smart_assistant", json=payload, timeout=120)
+            ok = reply_ok(response)
+            try:
+                intent = (response.json().get("data") or {}).get("type") or ("error" if not ok else "other")
+            except ValueError:
+                pass
+        except requests.RequestException:
+            pass
+        with lock:
+            samples.append((intent, time.perf_counter() - start, ok))
+
+    # Payloads (including stand-in images) are built up front so the send loop
+    # only sleeps and submits.
+    scheduled = [((entry.get("ts", origin) - origin) / speed, entry, build_payload(entry)) for entry in entries]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for offset, entry, payload in scheduled:
+            delay = offset - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lags.append(-delay)
+            pool.submit(send, entry, payload)
+    return samples, time.perf_counter() - started, lags
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="JSONL file written by CAPTURE_FILE")
+    parser.add_argument("--url", help="replay against this server instead of an in-process one")
+    parser.add_argument("--speed", type=float, default=1.0, help="rate multiplier (2 = twice as fast)")
+    parser.add_argument("--limit", type=int, help="replay only the first N captured requests")
+    parser.add_argument("--max-workers", type=int, default=64, help="cap on concurrent in-flight requests")
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=MS", help="fake upstream latency")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.speed <= 0:
+        raise SystemExit("--speed must be positive")
+    entries = load_capture(args.capture, args.limit)
+    if not entries:
+        raise SystemExit("capture is empty")
+
+    fakes = server = api = None
+    base_url = args.url
+    if not base_url:
+        from loadtest import parse_upstream_values
+
+        fakes = FakeUpstreams(build_profiles(latency=parse_upstream_values(args.latency, float)), districts=[]).start()
+        api = load_api(fakes)
+        fakes.server.districts = list(api.GUJARAT_DISTRICTS)
+        server, base_url = serve_app(api.app)
+
+    try:
+        samples, elapsed, lags = replay(base_url.rstrip("/"), entries, args.speed, args.max_workers)
+    finally:
+        if server:
+            server.shutdown()
+        if fakes:
+            fakes.stop()
+
+    captured_span = entries[-1].get("ts", 0) - entries[0].get("ts", 0)
+    report = summarize(samples, elapsed)
+    lags.sort()
+    report["replay"] = {
+        "captured_requests": len(entries),
+        "captured_span_s": round(captured_span, 2),
+        "speed": args.speed,
+        "late_sends": len(lags),
+        "p99_send_lag_ms": round(percentile(lags, 99) * 1000, 1) if lags else 0.0,
+    }
+    if api is not None:
+        report["caches"] = {
+            name: {"hits": cache.hits, "misses": cache.misses, "entries": len(cache)}
+            for name, cache in api.CACHES.items()
+        }
+    if fakes is not None:
+        report["upstreams"] = fakes.stats()
+        health, report["warnings"] = upstream_health(report, report["upstreams"], api)
+        for name, row in health.items():
+            report["upstreams"][name].update(row)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return report
+
+    print_report(report, report.get("upstreams", {}))
+    replay_info = report["replay"]
+    print(f"\nreplayed {replay_info['captured_requests']} requests spanning {replay_info['captured_span_s']}s "
+          f"at {args.speed}x; {replay_info['late_sends']} sent late (p99 lag {replay_info['p99_send_lag_ms']} ms)")
+    for name, row in report.get("caches", {}).items():
+        lookups = row["hits"] + row["misses"]
+        ratio = f"{row['hits'] / lookups:.0%}" if lookups else "-"
+        print(f"  cache {name:<20} hit ratio {ratio:>5} ({row['entries']} entries)")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold-start benchmark for api.py.
+
+Each run is a fresh interpreter that imports api and reports the wall time
+and the resident set size afterwards. Lazy mode is the default import, with
+boto3, anthropic, Pillow and deep_translator deferred. Eager mode also calls
+prewarm_dependencies() before measuring, which matches what the old
+top-level imports cost.
+
+    python bench/startup.py
+    python bench/startup.py --runs 10 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import os, sys, time, json
+start = time.perf_counter()
+import api
+if sys.argv[1] == "eager":
+    api.prewarm_dependencies()
+elapsed = time.perf_counter() - start
+with open("/proc/self/statm") as statm:
+    rss = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+heavy = [name for name in ("boto3", "anthropic", "PIL.Image", "deep_translator") if name in sys.modules]
+print(json.dumps({"import_s": elapsed, "rss_bytes": rss, "modules": len(sys.modules), "heavy": heavy}))
+"""
+
+# Fake credentials so eager mode builds both clients; nothing is contacted.
+PROBE_ENV = {
+    "LOG_LEVEL": "ERROR",
+    "ARRIVALS_SYNC_INTERVAL": "0",
+    "CLAUDE_API_KEY": "startup-bench",
+    "AWS_ACCESS_KEY_ID": "startup-bench",
+    "AWS_SECRET_ACCESS_KEY": "startup-bench",
+    "MODEL_ARN": "arn:aws:rekognition:ap-south-1:000000000000:project/bench/version/bench/1",
+}
+
+
+def probe(mode):
+    env = dict(os.environ, **PROBE_ENV)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, mode], cwd=REPO_ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    import_ms = [run["import_s"] * 1000 for run in runs]
+    rss_mb = [run["rss_bytes"] / (1024 * 1024) for run in runs]
+    return {
+        "runs": len(runs),
+        "import_ms": {"median": round(statistics.median(import_ms), 1),
+                      "min": round(min(import_ms), 1), "max": round(max(import_ms), 1)},
+        "rss_mb": {"median": round(statistics.median(rss_mb), 1),
+                   "min": round(min(rss_mb), 1), "max": round(max(rss_mb), 1)},
+        "modules": runs[-1]["modules"],
+        "heavy_imported": runs[-1]["heavy"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    # One throwaway run per mode so both start with a warm page cache
+    report = {}
+    for mode in ("lazy", "eager"):
+        probe(mode)
+        report[mode] = summarize([probe(mode) for _ in range(args.runs)])
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return report
+
+    print(f"{'mode':<8}{'import ms (median/min/max)':>30}{'rss MB (median)':>18}{'modules':>10}")
+    for mode, row in report.items():
+        timing = row["import_ms"]
+        print(f"{mode:<8}{timing['median']:>14} / {timing['min']} / {timing['max']:<8}"
+              f"{row['rss_mb']['median']:>14}{row['modules']:>10}")
+    lazy, eager = report["lazy"], report["eager"]
+    print(f"\nlazy import saves {eager['import_ms']['median'] - lazy['import_ms']['median']:.0f} ms and "
+          f"{eager['rss_mb']['median'] - lazy['rss_mb']['median']:.1f} MB; "
+          f"heavy modules loaded lazily: {', '.join(lazy['heavy_imported']) or 'none'}")
+    return report
+
+
+if __name__ == "__main__":
+    main()